@@ -1,22 +1,28 @@
+import base64
 import json
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
 import uuid
 from api.shop import *
+from api.storage import create_backend
+from api import export
 import os
 
 app = FastAPI(title="Shop API")
 
-# --- In-memory repositories and services ---
-users = UserRepository()
-products = ProductRepository()
-carts = CartRepository()
-orders = OrderRepository()
-invoices = InvoiceRepository()
-payments = PaymentRepository()
-threads = ThreadRepository()
-sessions = SessionManager()
+# --- Repositories (backend choisi par SHOP_STORAGE=memory|sqlite|journal) and services ---
+storage = create_backend(os.environ.get("SHOP_STORAGE", "memory"), os.environ.get("SHOP_DB_PATH"))
+users = storage.users
+products = storage.products
+carts = storage.carts
+orders = storage.orders
+invoices = storage.invoices
+payments = storage.payments
+threads = storage.threads
+sessions = storage.sessions
 gateway = PaymentGateway()
 billing = BillingService(invoices)
 delivery_svc = DeliveryService()
@@ -34,16 +40,36 @@ def load_test_data(json_path, users_repo, products_repo, carts_repo):
         return
     with open(json_path, 'r') as f:
         data = json.load(f)
+    # Un backend persistant conserve ses données: on n'écrase pas l'existant
     for u in data.get('users', []):
+        if users_repo.get(u['id']):
+            continue
         u['password_hash'] = PasswordHasher.hash(u.pop('password'))
         user = User(**u)
         users_repo.add(user)
     for p in data.get('products', []):
+        if products_repo.get(p['id']):
+            continue
         product = Product(**p)
         products_repo.add(product)
 
 load_test_data(os.path.join(os.path.dirname(__file__), 'test_data.json'), users, products, carts)
 
+
+@app.middleware("http")
+async def durable_writes(request, call_next):
+    """Une seule attente de durabilité par requête (journal: un fsync groupé)."""
+    with storage.durable(wait=False) as scope:
+        response = await call_next(request)
+    await run_in_threadpool(storage.wait_durable, scope)
+    return response
+
+
+@app.on_event("shutdown")
+def close_storage():
+    """Rend les écritures durables (journal, SQLite) à l'arrêt."""
+    storage.close()
+
 # --- Models for API input/output ---
 class UserIn(BaseModel):
     email: str
@@ -113,11 +139,8 @@ def update_user_profile(user_id: str, data: UserUpdate):
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    user.update_profile(
-        first_name=data.first_name,
-        last_name=data.last_name,
-        address=data.address
-    )
+    user.update_profile(**data.dict(exclude_none=True))
+    users.add(user)
     return user
 
 
@@ -190,7 +213,10 @@ def update_product(product_id: str, product: ProductIn):
     existing.name = product.name
     existing.description = product.description
     existing.price_cents = product.price_cents
+    # `existing` peut être une copie détachée (SQLite): elle doit porter le
+    # nouveau stock, sinon `add` réécrirait l'ancienne valeur
     existing.stock_qty = product.stock_qty
+    products.set_stock(product_id, product.stock_qty)
     if product.active is not None:
         existing.active = product.active if product.stock_qty > 0 else False
     else:
@@ -217,8 +243,7 @@ def add_to_cart(user_id: str, item: CartItemIn):
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     try:
-        carts.get_or_create(user_id).add(product, item.quantity)
-        return carts.get_or_create(user_id)
+        return cart_svc.add_to_cart(user_id, item.product_id, item.quantity)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -227,27 +252,26 @@ def remove_from_cart(user_id: str, item: CartItemIn):
     """Retire une quantité d’un produit du panier.\n
     Body: product_id, quantity\n
     Retourne le panier mis à jour."""
-    carts.get_or_create(user_id).remove(item.product_id, item.quantity)
-    return carts.get_or_create(user_id)
+    return cart_svc.remove_from_cart(user_id, item.product_id, item.quantity)
 
 @app.delete("/cart/{user_id}/clear")
 def clear_cart(user_id: str):
     """Vide le panier de l’utilisateur.\n
     Retourne {"ok": true}"""
-    carts.get_or_create(user_id).clear()
+    cart_svc.clear_cart(user_id)
     return {"ok": True}
 
 @app.get("/cart/{user_id}")
 def view_cart(user_id: str):
     """Récupère le panier de l’utilisateur.\n
     Retourne l’objet Cart."""
-    return carts.get_or_create(user_id)
+    return cart_svc.view_cart(user_id)
 
 @app.get("/cart/{user_id}/total")
 def cart_total(user_id: str):
     """Calcule le total du panier en centimes.\n
     Retourne {"total_cents": ...}"""
-    return {"total_cents": carts.get_or_create(user_id).total_cents(products)}
+    return {"total_cents": cart_svc.cart_total(user_id)}
 
 # --- Order endpoints ---
 @app.post("/orders/checkout/{user_id}")
@@ -364,18 +388,84 @@ def get_order_invoice(order_id: str):
     inv = invoices.get(order.invoice_id)
     return inv
 
+ADMIN_ORDERS_MAX_LIMIT = 1000
+
+
+def encode_cursor(key) -> str:
+    """Encode une clé de parcours (created_at, id) en curseur opaque."""
+    return base64.urlsafe_b64encode(json.dumps([key[0], key[1]]).encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    """Décode un curseur produit par `encode_cursor` (400 s'il est invalide)."""
+    try:
+        created_at, order_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(created_at), str(order_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Curseur invalide")
+
+
 @app.get("/admin/orders")
-def admin_list_orders(admin_user_id: str):
+def admin_list_orders(admin_user_id: str, limit: int = 100, after: Optional[str] = None,
+                      status: Optional[str] = None, user_id: Optional[str] = None,
+                      created_from: Optional[float] = None, created_to: Optional[float] = None):
     """
-    Liste toutes les commandes (réservé aux admins).
-    Paramètre: admin_user_id (doit être un admin)
-    Retour : Toutes les commandes du système
+    Liste paginée des commandes (réservé aux admins).
+    Paramètres:
+        - admin_user_id (doit être un admin)
+        - limit (1 à 1000, défaut 100), after (curseur `next_cursor` de la page précédente)
+        - filtres optionnels: status (ex: PAYEE), user_id, created_from / created_to (timestamps, [from, to[)
+    Retour : {"items": [...], "next_cursor": str ou null}, commandes triées par date de création.
+    Le curseur reste valide si des commandes sont créées entre deux pages.
     """
     admin = users.get(admin_user_id)
     if not admin or not admin.is_admin:
         raise HTTPException(status_code=403, detail="Accès réservé aux administrateurs")
+    if not 1 <= limit <= ADMIN_ORDERS_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit doit être entre 1 et {ADMIN_ORDERS_MAX_LIMIT}")
+    if status is not None and status not in OrderStatus.__members__:
+        raise HTTPException(status_code=400, detail="Statut inconnu")
+
+    items, next_key = orders.page(
+        limit,
+        after=decode_cursor(after) if after else None,
+        status=OrderStatus[status] if status else None,
+        user_id=user_id,
+        created_from=created_from,
+        created_to=created_to,
+    )
+    return {"items": items, "next_cursor": encode_cursor(next_key) if next_key else None}
 
-    return list(orders._by_id.values())
+
+@app.get("/admin/export/{kind}")
+def admin_export(kind: str, admin_user_id: str, format: str = "ndjson",
+                 created_from: Optional[float] = None, created_to: Optional[float] = None):
+    """
+    Export en flux des commandes, factures ou paiements (réservé aux admins).
+    Paramètres:
+        - kind: orders, invoices ou payments
+        - format: ndjson (défaut) ou csv
+        - created_from / created_to: filtre de date, commandes uniquement
+    Retour : StreamingResponse sérialisée ligne par ligne, mémoire constante.
+    """
+    admin = users.get(admin_user_id)
+    if not admin or not admin.is_admin:
+        raise HTTPException(status_code=403, detail="Accès réservé aux administrateurs")
+    if format not in export.FORMATS:
+        raise HTTPException(status_code=400, detail="Format inconnu (ndjson ou csv)")
+    sources = {
+        "orders": lambda: orders.iter_all(created_from=created_from, created_to=created_to),
+        "invoices": invoices.iter_all,
+        "payments": payments.iter_all,
+    }
+    if kind not in sources:
+        raise HTTPException(status_code=404, detail="Export inconnu")
+
+    return StreamingResponse(
+        export.stream(kind, format, sources[kind]()),
+        media_type=export.FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{kind}.{format}"'},
+    )
 
 # --- Invoice endpoints ---
 @app.get("/invoices/{invoice_id}")
@@ -443,9 +533,12 @@ def get_thread_messages(thread_id: str):
     return thread.messages
 
 @app.get("/admin/threads")
-def list_all_threads():
-    """Liste tous les fils de discussion (tickets) — réservé aux admins."""
-    return list(threads._by_id.values())
+def list_all_threads(closed: Optional[bool] = None):
+    """Liste les fils de discussion (tickets) — réservé aux admins.\n
+    Param optionnel: closed (false = file d'attente des tickets ouverts, true = tickets fermés)."""
+    if closed is None:
+        return threads.list_all()
+    return threads.list_by_state(closed)
 
 @app.get("/admin/threads/{thread_id}/messages")
 def admin_get_thread_messages(thread_id: str):
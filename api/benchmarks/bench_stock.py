@@ -0,0 +1,127 @@
+"""Stress test multi-thread des réservations de stock (`OrderService.checkout`).
+
+Simule une vente flash: plusieurs threads enchaînent panier + checkout sur
+quelques produits "chauds" au stock limité et sur un catalogue de produits
+"froids". À la fin, on vérifie qu'aucune unité n'a été survendue:
+
+    stock initial - stock final == quantités commandées, stock final >= 0
+
+Avec `--lines N`, chaque panier contient en plus N-1 produits froids
+(paniers B2B): un checkout refusé ne doit débiter aucune de ses lignes.
+
+Usage:
+    python -m api.benchmarks.bench_stock --threads 16 --checkouts 20000
+    python -m api.benchmarks.bench_stock --lines 50 --checkouts 4000
+"""
+import argparse
+import sys
+import threading
+import time
+
+from api.shop import (
+    BillingService, CartRepository, CartService, DeliveryService,
+    InvoiceRepository, OrderRepository, OrderService, PaymentGateway,
+    PaymentRepository, Product, ProductRepository, UserRepository,
+)
+
+
+def build_services(hot: int, cold: int, hot_stock: int):
+    """Construit les repositories/services et le catalogue du test."""
+    products = ProductRepository()
+    carts = CartRepository()
+    orders = OrderRepository()
+    invoices = InvoiceRepository()
+    order_svc = OrderService(
+        orders, products, carts, PaymentRepository(), invoices,
+        BillingService(invoices), DeliveryService(), PaymentGateway(), UserRepository()
+    )
+    for i in range(hot):
+        products.add(Product(id=f"hot-{i}", name=f"Hot {i}", description="", price_cents=100, stock_qty=hot_stock))
+    for i in range(cold):
+        products.add(Product(id=f"cold-{i}", name=f"Cold {i}", description="", price_cents=100, stock_qty=10**9))
+    return products, orders, CartService(carts, products), order_svc
+
+
+def run(threads: int, checkouts: int, hot: int, cold: int, hot_stock: int, lines: int = 1) -> dict:
+    """Lance le stress test et retourne les mesures."""
+    products, orders, cart_svc, order_svc = build_services(hot, cold, hot_stock)
+    initial = {p.id: p.stock_qty for p in products.list_all()}
+    per_thread = checkouts // threads
+    counters = {"ok": 0, "refused": 0}
+    counters_lock = threading.Lock()
+    start_barrier = threading.Barrier(threads + 1)
+
+    def worker(n: int):
+        ok = refused = 0
+        start_barrier.wait()
+        for i in range(per_thread):
+            user_id = f"t{n}-{i}"
+            # Un produit chaud sur deux checkouts, sinon un produit froid
+            pid = f"hot-{i % hot}" if i % 2 == 0 else f"cold-{(n * per_thread + i) % cold}"
+            try:
+                cart_svc.add_to_cart(user_id, pid, 1)
+                for j in range(1, lines):
+                    cart_svc.add_to_cart(user_id, f"cold-{(i + j) % cold}", 1)
+                order_svc.checkout(user_id)
+                ok += 1
+            except ValueError:
+                refused += 1
+        with counters_lock:
+            counters["ok"] += ok
+            counters["refused"] += refused
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for t in pool:
+        t.start()
+    start_barrier.wait()
+    t0 = time.perf_counter()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    ordered: dict = {}
+    for order in orders._by_id.values():
+        for item in order.items:
+            ordered[item.product_id] = ordered.get(item.product_id, 0) + item.quantity
+    oversold = 0
+    for pid, qty0 in initial.items():
+        p = products.get(pid)
+        if p.stock_qty < 0 or qty0 - p.stock_qty != ordered.get(pid, 0):
+            oversold += 1
+    return {
+        "threads": threads,
+        "lines_per_cart": lines,
+        "attempts": per_thread * threads,
+        "checkouts_ok": counters["ok"],
+        "checkouts_refused": counters["refused"],
+        "elapsed_s": round(elapsed, 3),
+        "checkouts_per_s": round((per_thread * threads) / elapsed, 1),
+        "oversold_products": oversold,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--checkouts", type=int, default=20000)
+    parser.add_argument("--lines", type=int, default=1, help="lignes par panier")
+    parser.add_argument("--hot", type=int, default=4, help="nombre de produits chauds")
+    parser.add_argument("--cold", type=int, default=1000, help="nombre de produits froids")
+    parser.add_argument("--hot-stock", type=int, default=1000, help="stock initial des produits chauds")
+    parser.add_argument("--switch-interval", type=float, default=1e-5,
+                        help="sys.setswitchinterval, plus petit = plus d'entrelacements")
+    args = parser.parse_args(argv)
+
+    sys.setswitchinterval(args.switch_interval)
+    res = run(args.threads, args.checkouts, args.hot, args.cold, args.hot_stock, args.lines)
+    for k, v in res.items():
+        print(f"{k:>20}: {v}")
+    if res["oversold_products"]:
+        print("ÉCHEC: survente détectée")
+        return 1
+    print("OK: aucune survente")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
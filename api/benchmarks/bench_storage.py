@@ -0,0 +1,79 @@
+"""Compare le débit du parcours checkout -> paiement -> facture selon le backend.
+
+Pour chaque backend (mémoire, SQLite, journal), on enchaîne `iterations` fois:
+ajout au panier, `OrderService.checkout`, `OrderService.pay_by_card` (qui
+émet la facture), éventuellement depuis plusieurs threads.
+
+Usage:
+    python -m api.benchmarks.bench_storage --iterations 2000 --threads 4
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from api.shop import (
+    BillingService, CartService, DeliveryService, OrderService, PaymentGateway, Product,
+)
+from api.storage import create_backend
+
+
+def run(kind: str, iterations: int, threads: int, db_path: str = None) -> dict:
+    """Mesure le parcours complet sur le backend `kind`."""
+    backend = create_backend(kind, db_path)
+    billing = BillingService(backend.invoices)
+    cart_svc = CartService(backend.carts, backend.products)
+    order_svc = OrderService(
+        backend.orders, backend.products, backend.carts, backend.payments, backend.invoices,
+        billing, DeliveryService(), PaymentGateway(), backend.users
+    )
+    for i in range(100):
+        backend.products.add(Product(id=f"p{i}", name=f"P{i}", description="", price_cents=100 + i, stock_qty=10**9))
+    per_thread = iterations // threads
+
+    def worker(n: int):
+        for i in range(per_thread):
+            user_id = f"u{n}-{i}"
+            # Une portée par parcours, comme une requête HTTP: un seul fsync attendu
+            with backend.durable():
+                cart_svc.add_to_cart(user_id, f"p{i % 100}", 1)
+                order = order_svc.checkout(user_id)
+                order_svc.pay_by_card(order.id, "4242424242424242", 12, 2030, "123")
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    t0 = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    backend.close()
+    done = per_thread * threads
+    return {
+        "backend": kind,
+        "threads": threads,
+        "flows": done,
+        "elapsed_s": round(elapsed, 3),
+        "flows_per_s": round(done / elapsed, 1),
+        "us_per_flow": round(elapsed / done * 1e6, 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {"memory": None, "sqlite": os.path.join(tmp, "bench.db"), "journal": os.path.join(tmp, "journal")}
+        for kind, path in paths.items():
+            res = run(kind, args.iterations, args.threads, path)
+            print("  ".join(f"{k}={v}" for k, v in res.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""Export en flux des commandes, factures et paiements (NDJSON ou CSV).
+
+Les générateurs de ce module consomment les `iter_all` des repositories et
+sérialisent ligne par ligne: la mémoire reste constante quelle que soit la
+taille de l'historique, et le premier octet part dès la première ligne.
+
+- NDJSON: un objet JSON par ligne, au format du codec de `api.storage`
+  (statuts par nom, lignes de commande/facture imbriquées);
+- CSV: une ligne par objet, colonnes à plat (voir `CSV_COLUMNS`).
+
+`stream` regroupe les lignes en blocs d'environ `CHUNK_BYTES`: Starlette
+passe chaque `next()` d'un générateur synchrone par le pool de threads,
+un bloc par ligne coûterait un aller-retour de thread par objet.
+"""
+from __future__ import annotations
+
+import csv
+import io
+import json
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+
+from api.storage import to_primitive
+
+CHUNK_BYTES = 64 * 1024
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+# Colonnes CSV par type d'export: (en-tête, extraction depuis l'objet)
+CSV_COLUMNS: Dict[str, List[Tuple[str, Callable[[Any], Any]]]] = {
+    "orders": [
+        ("id", lambda o: o.id),
+        ("user_id", lambda o: o.user_id),
+        ("status", lambda o: o.status.name),
+        ("created_at", lambda o: o.created_at),
+        ("items", lambda o: len(o.items)),
+        ("total_cents", lambda o: o.total_cents()),
+        ("paid_at", lambda o: o.paid_at),
+        ("invoice_id", lambda o: o.invoice_id),
+        ("payment_id", lambda o: o.payment_id),
+    ],
+    "invoices": [
+        ("id", lambda i: i.id),
+        ("order_id", lambda i: i.order_id),
+        ("user_id", lambda i: i.user_id),
+        ("lines", lambda i: len(i.lines)),
+        ("total_cents", lambda i: i.total_cents),
+        ("issued_at", lambda i: i.issued_at),
+    ],
+    "payments": [
+        ("id", lambda p: p.id),
+        ("order_id", lambda p: p.order_id),
+        ("user_id", lambda p: p.user_id),
+        ("amount_cents", lambda p: p.amount_cents),
+        ("provider", lambda p: p.provider),
+        ("provider_ref", lambda p: p.provider_ref),
+        ("succeeded", lambda p: p.succeeded),
+        ("created_at", lambda p: p.created_at),
+    ],
+}
+
+
+def ndjson_lines(rows: Iterable[Any]) -> Iterator[str]:
+    """Sérialise chaque objet en une ligne JSON."""
+    for row in rows:
+        yield json.dumps(to_primitive(row), ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def csv_lines(kind: str, rows: Iterable[Any]) -> Iterator[str]:
+    """Sérialise les objets en CSV (en-tête puis une ligne par objet)."""
+    columns = CSV_COLUMNS[kind]
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+
+    def flush() -> str:
+        line = buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+        return line
+
+    writer.writerow([name for name, _ in columns])
+    yield flush()
+    for row in rows:
+        writer.writerow(["" if (v := get(row)) is None else v for _, get in columns])
+        yield flush()
+
+
+def chunked(lines: Iterable[str], chunk_bytes: int = CHUNK_BYTES) -> Iterator[str]:
+    """Regroupe des lignes en blocs d'au moins `chunk_bytes` caractères (sauf le dernier)."""
+    batch: List[str] = []
+    size = 0
+    for line in lines:
+        batch.append(line)
+        size += len(line)
+        if size >= chunk_bytes:
+            yield "".join(batch)
+            batch.clear()
+            size = 0
+    if batch:
+        yield "".join(batch)
+
+
+def stream(kind: str, fmt: str, rows: Iterable[Any], chunk_bytes: int = CHUNK_BYTES) -> Iterator[str]:
+    """Générateur de blocs de lignes pour `kind` (orders/invoices/payments) au format `fmt`."""
+    if kind not in CSV_COLUMNS:
+        raise ValueError("Type d'export inconnu.")
+    if fmt == "ndjson":
+        return chunked(ndjson_lines(rows), chunk_bytes)
+    if fmt == "csv":
+        return chunked(csv_lines(kind, rows), chunk_bytes)
+    raise ValueError("Format d'export inconnu.")
@@ -1,7 +1,12 @@
 from __future__ import annotations
 from dataclasses import dataclass, field
 from enum import Enum, auto
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
+import bisect
+import hashlib
+import hmac
+import os
+import threading
 import uuid
 import time
 
@@ -62,15 +67,28 @@ class UserRepository:
     
 class PasswordHasher:
     """Outils de hachage/verification de mot de passe.
+
+    Format: `sha256::<sel hex>::<condensé hex>`. Le haché ne dépend que du
+    mot de passe et du sel: il reste vérifiable depuis un autre processus
+    (workers, redémarrage avec un backend persistant).
     """
     @staticmethod
-    def hash(password: str) -> str:
-        return f"sha256::{hash(password)}"
+    def hash(password: str, salt: Optional[bytes] = None) -> str:
+        salt = os.urandom(16) if salt is None else salt
+        digest = hashlib.sha256(salt + password.encode("utf-8")).hexdigest()
+        return f"sha256::{salt.hex()}::{digest}"
 
     @staticmethod
     def verify(password: str, stored_hash: str) -> bool:
         """Vérifie si le mot de passe correspond au haché stocké."""
-        return PasswordHasher.hash(password) == stored_hash
+        try:
+            scheme, salt_hex, _ = stored_hash.split("::")
+            salt = bytes.fromhex(salt_hex)
+        except ValueError:
+            return False
+        if scheme != "sha256":
+            return False
+        return hmac.compare_digest(PasswordHasher.hash(password, salt), stored_hash)
     
 class SessionManager:
     """Gestion simple de sessions en mémoire.
@@ -94,6 +112,14 @@ class SessionManager:
         """Retourne l'user_id associé au token ou None."""
         return self._sessions.get(token)
 
+    def restore_session(self, token: str, user_id: str):
+        """Réinstalle une session existante (rechargement après redémarrage)."""
+        self._sessions[token] = user_id
+
+    def list_sessions(self) -> List[Tuple[str, str]]:
+        """Liste les sessions actives sous forme (token, user_id)."""
+        return list(self._sessions.items())
+
 class AuthService:
     """Service d'authentification: inscription/login/logout.
 
@@ -151,10 +177,100 @@ class Product:
     stock_qty: int
     active: bool = True
 
+class StockEngine:
+    """Moteur de réservation de stock thread-safe.
+
+    FastAPI exécute les endpoints synchrones dans un pool de threads: la
+    séquence lecture/vérification/écriture sur `Product.stock_qty` doit donc
+    être atomique. Chaque produit est associé à un verrou parmi `stripes`
+    (verrouillage par bandes): deux réservations sur un même produit sont
+    sérialisées, deux produits distincts ne partagent un verrou qu'en cas de
+    collision de hash.
+    """
+    def __init__(self, stripes: int = 256):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def _stripe(self, product_id: str) -> int:
+        return hash(product_id) % len(self._locks)
+
+    def lock_for(self, product_id: str) -> threading.Lock:
+        """Retourne le verrou protégeant le stock du produit donné."""
+        return self._locks[self._stripe(product_id)]
+
+    def reserve(self, product: Product, qty: int, deactivate_when_empty: bool = False) -> int:
+        """Débite `qty` unités de façon atomique et retourne le stock restant.
+
+        Si `deactivate_when_empty` est vrai, le produit est désactivé dans la
+        même section critique lorsque son stock tombe à zéro.
+
+        Raises:
+            ValueError: si le stock est insuffisant.
+        """
+        with self.lock_for(product.id):
+            if product.stock_qty < qty:
+                raise ValueError("Stock insuffisant.")
+            product.stock_qty -= qty
+            if deactivate_when_empty and product.stock_qty <= 0:
+                product.active = False
+            return product.stock_qty
+
+    def reserve_many(self, lines: List[Tuple[Product, int]], deactivate_when_empty: bool = False):
+        """Réserve plusieurs lignes en tout-ou-rien.
+
+        Les verrous de toutes les lignes sont pris dans l'ordre croissant des
+        bandes (pas d'interblocage entre deux paniers), puis:
+        1. validation de toutes les lignes (produit actif, stock suffisant);
+        2. débit de toutes les lignes.
+        Un échec en phase 1 ne modifie aucun stock: aucune compensation
+        n'est nécessaire. Les quantités d'un même produit sont cumulées.
+
+        Raises:
+            ValueError: produit inactif ou stock insuffisant.
+        """
+        wanted: Dict[str, int] = {}
+        by_id: Dict[str, Product] = {}
+        for product, qty in lines:
+            wanted[product.id] = wanted.get(product.id, 0) + qty
+            by_id[product.id] = product
+        locks = [self._locks[i] for i in sorted({self._stripe(pid) for pid in wanted})]
+        for lock in locks:
+            lock.acquire()
+        try:
+            for pid, qty in wanted.items():
+                p = by_id[pid]
+                if not p.active:
+                    raise ValueError("Produit indisponible.")
+                if p.stock_qty < qty:
+                    raise ValueError(f"Stock insuffisant pour {p.name}.")
+            for pid, qty in wanted.items():
+                p = by_id[pid]
+                p.stock_qty -= qty
+                if deactivate_when_empty and p.stock_qty <= 0:
+                    p.active = False
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    def release(self, product: Product, qty: int) -> int:
+        """Recrédite `qty` unités de façon atomique et retourne le stock."""
+        with self.lock_for(product.id):
+            product.stock_qty += qty
+            return product.stock_qty
+
+    def set_level(self, product: Product, qty: int) -> int:
+        """Fixe le niveau de stock (inventaire, back-office)."""
+        with self.lock_for(product.id):
+            product.stock_qty = qty
+            return product.stock_qty
+
 class ProductRepository:
-    """Repository en mémoire des produits disponibles."""
-    def __init__(self):
+    """Repository en mémoire des produits disponibles.
+
+    Les mouvements de stock passent par un `StockEngine` partagé.
+    """
+    def __init__(self, stock: Optional[StockEngine] = None):
         self._by_id: Dict[str, Product] = {}
+        self.stock = stock or StockEngine()
 
     def add(self, product: Product):
         """Ajoute ou met à jour un produit."""
@@ -172,21 +288,44 @@ class ProductRepository:
         """Liste tous les produits, actifs ou non."""
         return list(self._by_id.values())
 
-    def reserve_stock(self, product_id: str, qty: int):
+    def reserve_stock(self, product_id: str, qty: int, deactivate_when_empty: bool = False) -> int:
         """Réserve (débite) `qty` unités du stock d'un produit.
 
-        Lève ValueError si produit introuvable ou stock insuffisant.
+        Retourne le stock restant. Lève ValueError si produit introuvable ou
+        stock insuffisant.
         """
         p = self.get(product_id)
-        if not p or p.stock_qty < qty:
+        if not p:
             raise ValueError("Stock insuffisant.")
-        p.stock_qty -= qty
+        return self.stock.reserve(p, qty, deactivate_when_empty)
+
+    def reserve_many(self, lines: List[Tuple[str, int]], deactivate_when_empty: bool = False) -> List[Tuple[Product, int]]:
+        """Réserve un lot de lignes (product_id, qty) en tout-ou-rien.
+
+        Retourne les lignes résolues en (Product, qty), dans l'ordre reçu.
+        Lève ValueError si un produit est introuvable, inactif ou en stock
+        insuffisant; dans ce cas aucun stock n'est débité.
+        """
+        resolved: List[Tuple[Product, int]] = []
+        for product_id, qty in lines:
+            p = self.get(product_id)
+            if not p:
+                raise ValueError("Produit indisponible.")
+            resolved.append((p, qty))
+        self.stock.reserve_many(resolved, deactivate_when_empty)
+        return resolved
 
     def release_stock(self, product_id: str, qty: int):
         """Remet `qty` unités en stock pour le produit donné (si trouvé)."""
         p = self.get(product_id)
         if p:
-            p.stock_qty += qty
+            self.stock.release(p, qty)
+
+    def set_stock(self, product_id: str, qty: int):
+        """Fixe le stock d'un produit (si trouvé) sous le verrou du produit."""
+        p = self.get(product_id)
+        if p:
+            self.stock.set_level(p, qty)
 
 @dataclass
 class CartItem:
@@ -269,6 +408,10 @@ class CartRepository:
             self._by_user[user_id] = Cart(user_id=user_id)
         return self._by_user[user_id]
 
+    def update(self, cart: Cart):
+        """Enregistre un panier modifié (ou le remplace)."""
+        self._by_user[cart.user_id] = cart
+
     def clear(self, user_id: str):
         """Vide le panier de l'utilisateur donné."""
         self.get_or_create(user_id).clear()
@@ -297,11 +440,21 @@ class CartService:
         product = self.products.get(product_id)
         if not product:
             raise ValueError("Produit introuvable.")
-        self.carts.get_or_create(user_id).add(product, qty)
+        cart = self.carts.get_or_create(user_id)
+        cart.add(product, qty)
+        self.carts.update(cart)
+        return cart
 
     def remove_from_cart(self, user_id: str, product_id: str, qty: int = 1):
         """Retire `qty` du produit du panier de l'utilisateur."""
-        self.carts.get_or_create(user_id).remove(product_id, qty)
+        cart = self.carts.get_or_create(user_id)
+        cart.remove(product_id, qty)
+        self.carts.update(cart)
+        return cart
+
+    def clear_cart(self, user_id: str):
+        """Vide le panier de l'utilisateur."""
+        self.carts.clear(user_id)
 
     def view_cart(self, user_id: str) -> Cart:
         """Retourne l'objet `Cart` de l'utilisateur."""
@@ -363,15 +516,28 @@ class Order:
         return sum(i.unit_price_cents * i.quantity for i in self.items)
     
 class OrderRepository:
-    """Repository en mémoire pour les commandes."""
+    """Repository en mémoire pour les commandes.
+
+    Index secondaires maintenus par `add`/`update`:
+        - par utilisateur (ordre d'ajout);
+        - par statut (liste triée de (created_at, id));
+        - par date de création (liste triée de (created_at, id)).
+    Les services doivent appeler `update` après chaque changement de statut.
+    """
     def __init__(self):
         self._by_id: Dict[str, Order] = {}
         self._by_user: Dict[str, List[str]] = {}
+        self._by_status: Dict[OrderStatus, List[Tuple[float, str]]] = {}
+        self._by_created: List[Tuple[float, str]] = []
+        self._indexed: Dict[str, Tuple[OrderStatus, float]] = {}
+        self._lock = threading.Lock()
 
     def add(self, order: Order):
-        """Ajoute une commande et indexe par utilisateur."""
-        self._by_id[order.id] = order
-        self._by_user.setdefault(order.user_id, []).append(order.id)
+        """Ajoute une commande et indexe par utilisateur, statut et date."""
+        with self._lock:
+            self._by_id[order.id] = order
+            self._by_user.setdefault(order.user_id, []).append(order.id)
+            self._reindex(order)
 
     def get(self, order_id: str) -> Optional[Order]:
         """Retourne la commande par identifiant ou None."""
@@ -382,8 +548,99 @@ class OrderRepository:
         return [self._by_id[oid] for oid in self._by_user.get(user_id, [])]
 
     def update(self, order: Order):
-        """Met à jour une commande existante (ou la remplace)."""
-        self._by_id[order.id] = order
+        """Met à jour une commande existante (ou la remplace) et ses index."""
+        with self._lock:
+            self._by_id[order.id] = order
+            self._reindex(order)
+
+    def list_all(self) -> List[Order]:
+        """Liste toutes les commandes (ordre d'ajout)."""
+        return list(self._by_id.values())
+
+    def list_by_status(self, status: OrderStatus) -> List[Order]:
+        """Liste les commandes d'un statut donné par date croissante, en O(résultat)."""
+        return [self._by_id[oid] for _, oid in list(self._by_status.get(status, ()))]
+
+    def count_by_status(self) -> Dict[OrderStatus, int]:
+        """Nombre de commandes par statut."""
+        return {status: len(keys) for status, keys in self._by_status.items() if keys}
+
+    def list_created_between(self, start: Optional[float] = None, end: Optional[float] = None) -> List[Order]:
+        """Liste les commandes créées dans [start, end[, par date croissante."""
+        lo = 0 if start is None else bisect.bisect_left(self._by_created, (start,))
+        hi = len(self._by_created) if end is None else bisect.bisect_left(self._by_created, (end,))
+        return [self._by_id[oid] for _, oid in self._by_created[lo:hi]]
+
+    def page(self, limit: int, after: Optional[Tuple[float, str]] = None,
+             status: Optional[OrderStatus] = None, user_id: Optional[str] = None,
+             created_from: Optional[float] = None, created_to: Optional[float] = None
+             ) -> Tuple[List[Order], Optional[Tuple[float, str]]]:
+        """Parcours ordonné par (created_at, id), pour la pagination par curseur.
+
+        `after` est la clé (created_at, id) du dernier élément déjà lu: le
+        parcours reprend strictement après, donc une commande insérée entre
+        deux pages ne décale ni ne duplique rien. Les filtres sont combinés
+        (ET); la date est dans [created_from, created_to[.
+        Retour: (commandes, clé de reprise ou None si le parcours est terminé).
+        """
+        with self._lock:
+            if user_id is not None:
+                keys = sorted(
+                    (o.created_at, o.id) for o in map(self._by_id.get, self._by_user.get(user_id, ()))
+                    if status is None or o.status == status
+                )
+            elif status is not None:
+                keys = self._by_status.get(status, [])
+            else:
+                keys = self._by_created
+            lo = 0
+            if created_from is not None:
+                lo = bisect.bisect_left(keys, (created_from,))
+            if after is not None:
+                lo = max(lo, bisect.bisect_right(keys, after))
+            hi = len(keys) if created_to is None else bisect.bisect_left(keys, (created_to,))
+            batch = keys[lo:min(hi, lo + limit + 1)]
+            items = [self._by_id[oid] for _, oid in batch[:limit]]
+        next_key = batch[limit - 1] if len(batch) > limit else None
+        return items, next_key
+
+    def iter_all(self, chunk_size: int = 1000, **filters) -> Iterator[Order]:
+        """Itère sur les commandes par (created_at, id), `chunk_size` à la fois.
+
+        Chaque lot est lu via `page`: aucune copie de l'ensemble des commandes,
+        et le parcours reste cohérent si des commandes sont créées pendant l'itération.
+        """
+        after = None
+        while True:
+            items, after = self.page(chunk_size, after=after, **filters)
+            yield from items
+            if after is None:
+                return
+
+    def _reindex(self, order: Order):
+        # Appelé sous self._lock: déplace la commande entre les index si besoin
+        previous = self._indexed.get(order.id)
+        current = (order.status, order.created_at)
+        if previous == current:
+            return
+        key = (order.created_at, order.id)
+        if previous is not None:
+            old_key = (previous[1], order.id)
+            _remove_sorted(self._by_status[previous[0]], old_key)
+            if previous[1] != order.created_at:
+                _remove_sorted(self._by_created, old_key)
+        bisect.insort(self._by_status.setdefault(order.status, []), key)
+        if previous is None or previous[1] != order.created_at:
+            bisect.insort(self._by_created, key)
+        self._indexed[order.id] = current
+
+
+def _remove_sorted(keys: List[Tuple[float, str]], key: Tuple[float, str]):
+    """Retire `key` d'une liste triée si elle y est."""
+    i = bisect.bisect_left(keys, key)
+    if i < len(keys) and keys[i] == key:
+        del keys[i]
+
 
 @dataclass
 class InvoiceLine:
@@ -411,14 +668,32 @@ class InvoiceRepository:
     """Repository en mémoire pour les factures."""
     def __init__(self):
         self._by_id: Dict[str, Invoice] = {}
+        self._ids: List[str] = []
 
     def add(self, invoice: Invoice):
         """Ajoute une facture."""
+        if invoice.id not in self._by_id:
+            self._ids.append(invoice.id)
         self._by_id[invoice.id] = invoice
 
     def get(self, invoice_id: str) -> Optional[Invoice]:
         """Retourne la facture par identifiant ou None."""
         return self._by_id.get(invoice_id)
+
+    def iter_all(self, chunk_size: int = 1000) -> Iterator[Invoice]:
+        """Itère sur les factures (ordre d'ajout), `chunk_size` à la fois.
+
+        Parcours par position dans `_ids` (liste en ajout seul): aucune copie
+        de l'historique, et les factures ajoutées pendant l'itération sont vues.
+        """
+        i = 0
+        while True:
+            chunk = self._ids[i:i + chunk_size]
+            if not chunk:
+                return
+            i += len(chunk)
+            for invoice_id in chunk:
+                yield self._by_id[invoice_id]
     
 @dataclass
 class Payment:
@@ -436,14 +711,32 @@ class PaymentRepository:
     """Repository en mémoire pour les paiements."""
     def __init__(self):
         self._by_id: Dict[str, Payment] = {}
+        self._ids: List[str] = []
 
     def add(self, payment: Payment):
         """Ajoute un paiement au repository."""
+        if payment.id not in self._by_id:
+            self._ids.append(payment.id)
         self._by_id[payment.id] = payment
 
     def get(self, payment_id: str) -> Optional[Payment]:
         """Retourne le paiement par identifiant ou None."""
         return self._by_id.get(payment_id)
+
+    def iter_all(self, chunk_size: int = 1000) -> Iterator[Payment]:
+        """Itère sur les paiements (ordre d'ajout), `chunk_size` à la fois.
+
+        Parcours par position dans `_ids` (liste en ajout seul): aucune copie
+        de l'historique, et les paiements ajoutées pendant l'itération sont vues.
+        """
+        i = 0
+        while True:
+            chunk = self._ids[i:i + chunk_size]
+            if not chunk:
+                return
+            i += len(chunk)
+            for payment_id in chunk:
+                yield self._by_id[payment_id]
     
 @dataclass
 class Delivery:
@@ -567,27 +860,26 @@ class OrderService:
     def checkout(self, user_id: str) -> Order:
         """Crée une commande à partir du panier de l'utilisateur.
 
-        Réserve le stock et vide le panier.
+        Réserve le stock de toutes les lignes en une seule passe (tout ou
+        rien) et vide le panier. En cas d'échec, ni le stock ni le panier ne
+        sont modifiés.
         """
         cart = self.carts.get_or_create(user_id)
         if not cart.items:
             raise ValueError("Panier vide.")
-        order_items: List[OrderItem] = []
-        for it in cart.items.values():
-            p = self.products.get(it.product_id)
-            if not p or not p.active:
-                raise ValueError("Produit indisponible.")
-            if p.stock_qty < it.quantity:
-                raise ValueError(f"Stock insuffisant pour {p.name}.")
-            self.products.reserve_stock(p.id, it.quantity)
-            if p.stock_qty <= 0:
-                p.active = False
-            order_items.append(OrderItem(
+        reserved = self.products.reserve_many(
+            [(it.product_id, it.quantity) for it in cart.items.values()],
+            deactivate_when_empty=True
+        )
+        order_items: List[OrderItem] = [
+            OrderItem(
                 product_id=p.id,
                 name=p.name,
                 unit_price_cents=p.price_cents,
-                quantity=it.quantity
-            ))
+                quantity=qty
+            )
+            for p, qty in reserved
+        ]
         order = Order(
             id=str(uuid.uuid4()),
             user_id=user_id,
@@ -743,22 +1035,55 @@ class Message:
     created_at: float
 
 class ThreadRepository:
-    """Repository des fils de discussion / tickets de support."""
+    """Repository des fils de discussion / tickets de support.
+
+    Index secondaires maintenus par `add`/`update`:
+        - par utilisateur (ordre d'ajout);
+        - par état ouvert / fermé (file d'attente du support).
+    """
     def __init__(self):
         self._by_id: Dict[str, MessageThread] = {}
+        self._by_user: Dict[str, List[str]] = {}
+        self._by_closed: Dict[bool, Dict[str, None]] = {False: {}, True: {}}
+        self._indexed: Dict[str, bool] = {}
+        self._lock = threading.Lock()
 
     def add(self, thread: MessageThread):
         """Ajoute un fil de discussion."""
-        self._by_id[thread.id] = thread
+        self._store(thread)
 
     def get(self, thread_id: str) -> Optional[MessageThread]:
         """Récupère un fil par identifiant."""
         return self._by_id.get(thread_id)
 
+    def update(self, thread: MessageThread):
+        """Enregistre un fil modifié (nouveau message, fermeture) et ses index."""
+        self._store(thread)
+
+    def _store(self, thread: MessageThread):
+        with self._lock:
+            self._by_id[thread.id] = thread
+            previous = self._indexed.get(thread.id)
+            if previous is None:
+                self._by_user.setdefault(thread.user_id, []).append(thread.id)
+            elif previous != thread.closed:
+                self._by_closed[previous].pop(thread.id, None)
+            if previous != thread.closed:
+                self._by_closed[thread.closed][thread.id] = None
+                self._indexed[thread.id] = thread.closed
+
     def list_by_user(self, user_id: str) -> List[MessageThread]:
-        """Liste les fils appartenant à un utilisateur."""
-        return [t for t in self._by_id.values() if t.user_id == user_id]
-    
+        """Liste les fils appartenant à un utilisateur, en O(fils de l'utilisateur)."""
+        return [self._by_id[tid] for tid in list(self._by_user.get(user_id, ()))]
+
+    def list_all(self) -> List[MessageThread]:
+        """Liste tous les fils de discussion."""
+        return list(self._by_id.values())
+
+    def list_by_state(self, closed: bool) -> List[MessageThread]:
+        """Liste les fils ouverts (closed=False) ou fermés, en O(résultat)."""
+        return [self._by_id[tid] for tid in list(self._by_closed[closed])]
+
 class CustomerService:
     """Service support client: gestion des fils de discussion et messages."""
     def __init__(self, threads: ThreadRepository, users: UserRepository):
@@ -780,6 +1105,7 @@ class CustomerService:
             raise ValueError("Auteur inconnu.")
         msg = Message(id=str(uuid.uuid4()), thread_id=thread_id, author_user_id=author_user_id, body=body, created_at=time.time())
         th.messages.append(msg)
+        self.threads.update(th)
         return msg
 
     def close_thread(self, thread_id: str, admin_user_id: str):
@@ -791,4 +1117,5 @@ class CustomerService:
         if not th:
             raise ValueError("Fil introuvable.")
         th.closed = True
-        return th
\ No newline at end of file
+        self.threads.update(th)
+        return th
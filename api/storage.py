@@ -0,0 +1,650 @@
+"""Backends de stockage des repositories de `api.shop`.
+
+Deux implémentations exposent les mêmes repositories (mêmes méthodes
+publiques), ce qui permet aux services de `api.shop` de fonctionner sans
+modification quel que soit le backend:
+
+- `InMemoryBackend`: dictionnaires en mémoire (comportement historique);
+- `SQLiteBackend`: base SQLite persistante (mode WAL, une connexion par
+  thread, requêtes paramétrées mises en cache par sqlite3, colonnes
+  indexées pour user_id / status / created_at). Plusieurs workers uvicorn
+  peuvent partager le même fichier.
+
+Les objets à structure imbriquée (commandes, factures, paniers, fils de
+discussion) sont stockés en JSON dans une colonne `data`, à côté des
+colonnes d'index; utilisateurs et produits sont stockés à plat.
+"""
+from __future__ import annotations
+
+import dataclasses
+import json
+import sqlite3
+import threading
+import typing
+from contextlib import contextmanager
+from enum import Enum
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from api.shop import (
+    Cart, CartRepository, Invoice, InvoiceRepository, MessageThread, Order,
+    OrderRepository, OrderStatus, Payment, PaymentRepository, Product,
+    ProductRepository, SessionManager, ThreadRepository, User, UserRepository,
+)
+
+
+# ==========================================================
+# 🔁 SÉRIALISATION DES DATACLASSES
+# ==========================================================
+
+_hints_cache: Dict[type, Dict[str, Any]] = {}
+
+
+def _hints(cls: type) -> Dict[str, Any]:
+    hints = _hints_cache.get(cls)
+    if hints is None:
+        hints = _hints_cache[cls] = typing.get_type_hints(cls)
+    return hints
+
+
+def to_primitive(obj: Any) -> Any:
+    """Convertit récursivement une dataclass en types JSON (Enum -> nom)."""
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return {f.name: to_primitive(getattr(obj, f.name)) for f in dataclasses.fields(obj)}
+    if isinstance(obj, Enum):
+        return obj.name
+    if isinstance(obj, list):
+        return [to_primitive(v) for v in obj]
+    if isinstance(obj, dict):
+        return {k: to_primitive(v) for k, v in obj.items()}
+    return obj
+
+
+def from_primitive(tp: Any, value: Any) -> Any:
+    """Reconstruit une valeur de type `tp` à partir de `to_primitive`."""
+    if value is None:
+        return None
+    origin = typing.get_origin(tp)
+    if origin is typing.Union:
+        inner = [a for a in typing.get_args(tp) if a is not type(None)]
+        return from_primitive(inner[0], value)
+    if origin is list:
+        (item_tp,) = typing.get_args(tp)
+        return [from_primitive(item_tp, v) for v in value]
+    if origin is dict:
+        _, val_tp = typing.get_args(tp)
+        return {k: from_primitive(val_tp, v) for k, v in value.items()}
+    if isinstance(tp, type) and issubclass(tp, Enum):
+        return tp[value]
+    if dataclasses.is_dataclass(tp):
+        hints = _hints(tp)
+        return tp(**{
+            f.name: from_primitive(hints[f.name], value[f.name])
+            for f in dataclasses.fields(tp)
+            if f.init and f.name in value
+        })
+    return value
+
+
+def dumps(obj: Any) -> str:
+    """Sérialise une dataclass en JSON compact."""
+    return json.dumps(to_primitive(obj), separators=(",", ":"), ensure_ascii=False)
+
+
+def loads(cls: type, data: str) -> Any:
+    """Désérialise un JSON produit par `dumps` en instance de `cls`."""
+    return from_primitive(cls, json.loads(data))
+
+
+# ==========================================================
+# 🧠 BACKEND EN MÉMOIRE
+# ==========================================================
+
+class WriteScope:
+    """Portée d'écriture d'une requête: plus haute séquence de journal produite."""
+    __slots__ = ("last_seq",)
+
+    def __init__(self):
+        self.last_seq = 0
+
+
+class _ImmediateWrites:
+    """Portée `durable()` sans effet: les écritures n'ont pas d'acquittement différé."""
+
+    @contextmanager
+    def durable(self, wait: bool = True):
+        yield WriteScope()
+
+    def wait_durable(self, scope: WriteScope):
+        """Rien à attendre."""
+
+
+class InMemoryBackend(_ImmediateWrites):
+    """Backend historique: un repository en mémoire par agrégat."""
+    def __init__(self):
+        self.users = UserRepository()
+        self.products = ProductRepository()
+        self.carts = CartRepository()
+        self.orders = OrderRepository()
+        self.invoices = InvoiceRepository()
+        self.payments = PaymentRepository()
+        self.threads = ThreadRepository()
+        self.sessions = SessionManager()
+
+    def close(self):
+        """Rien à libérer pour le backend en mémoire."""
+
+
+# ==========================================================
+# 🗄️ BACKEND SQLITE
+# ==========================================================
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    email TEXT NOT NULL,
+    email_key TEXT NOT NULL UNIQUE,
+    password_hash TEXT NOT NULL,
+    first_name TEXT NOT NULL,
+    last_name TEXT NOT NULL,
+    address TEXT NOT NULL,
+    is_admin INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS products (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    description TEXT NOT NULL,
+    price_cents INTEGER NOT NULL,
+    stock_qty INTEGER NOT NULL,
+    active INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS carts (
+    user_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS orders (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    user_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS orders_user_id ON orders(user_id, seq);
+CREATE INDEX IF NOT EXISTS orders_status_created ON orders(status, created_at, id);
+CREATE INDEX IF NOT EXISTS orders_user_created ON orders(user_id, created_at, id);
+CREATE INDEX IF NOT EXISTS orders_created ON orders(created_at, id);
+DROP INDEX IF EXISTS orders_status;
+DROP INDEX IF EXISTS orders_created_at;
+CREATE TABLE IF NOT EXISTS invoices (
+    id TEXT PRIMARY KEY,
+    order_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS invoices_user_id ON invoices(user_id);
+CREATE TABLE IF NOT EXISTS payments (
+    id TEXT PRIMARY KEY,
+    order_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS payments_user_id ON payments(user_id);
+CREATE INDEX IF NOT EXISTS payments_created_at ON payments(created_at);
+CREATE TABLE IF NOT EXISTS threads (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    user_id TEXT NOT NULL,
+    closed INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS threads_user_id ON threads(user_id, seq);
+CREATE INDEX IF NOT EXISTS threads_created_at ON threads(created_at);
+CREATE INDEX IF NOT EXISTS threads_closed ON threads(closed, seq);
+"""
+
+
+class SQLiteDatabase:
+    """Accès à un fichier SQLite partagé entre threads (et processus).
+
+    Chaque thread dispose de sa propre connexion (sqlite3 interdit le partage
+    d'une connexion entre threads par défaut). Les connexions sont en
+    autocommit; les opérations multi-requêtes passent par `transaction()`.
+    """
+    def __init__(self, path: str, timeout: float = 30.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._all: List[sqlite3.Connection] = []
+        self._all_lock = threading.Lock()
+        self.connection().executescript(_SCHEMA)
+
+    def connection(self) -> sqlite3.Connection:
+        """Retourne la connexion du thread courant (créée à la demande)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.path,
+                timeout=self.timeout,
+                isolation_level=None,
+                check_same_thread=False,
+                cached_statements=256,
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._all_lock:
+                self._all.append(conn)
+        return conn
+
+    def execute(self, sql: str, params: Tuple = ()) -> sqlite3.Cursor:
+        """Exécute une requête paramétrée sur la connexion du thread."""
+        return self.connection().execute(sql, params)
+
+    @contextmanager
+    def transaction(self):
+        """Transaction en écriture (BEGIN IMMEDIATE): sérialise les écrivains."""
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+
+    def close(self):
+        """Ferme toutes les connexions ouvertes par cette instance."""
+        with self._all_lock:
+            for conn in self._all:
+                conn.close()
+            self._all.clear()
+        self._local = threading.local()
+
+
+def _user_from_row(row) -> User:
+    return User(id=row[0], email=row[1], password_hash=row[2], first_name=row[3],
+                last_name=row[4], address=row[5], is_admin=bool(row[6]))
+
+
+def _product_from_row(row) -> Product:
+    return Product(id=row[0], name=row[1], description=row[2], price_cents=row[3],
+                   stock_qty=row[4], active=bool(row[5]))
+
+
+_USER_COLS = "id, email, password_hash, first_name, last_name, address, is_admin"
+_PRODUCT_COLS = "id, name, description, price_cents, stock_qty, active"
+
+
+class SQLiteUserRepository:
+    """Équivalent SQLite de `UserRepository`."""
+    def __init__(self, db: SQLiteDatabase):
+        self.db = db
+
+    def add(self, user: User):
+        """Ajoute ou remplace un utilisateur."""
+        self.db.execute(
+            "INSERT OR REPLACE INTO users (id, email, email_key, password_hash, first_name, last_name, address, is_admin) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (user.id, user.email, user.email.lower(), user.password_hash, user.first_name,
+             user.last_name, user.address, int(user.is_admin)),
+        )
+
+    def get(self, user_id: str) -> Optional[User]:
+        """Retourne l'utilisateur par identifiant ou None."""
+        row = self.db.execute(f"SELECT {_USER_COLS} FROM users WHERE id = ?", (user_id,)).fetchone()
+        return _user_from_row(row) if row else None
+
+    def get_by_email(self, email: str) -> Optional[User]:
+        """Retourne l'utilisateur par email (insensible à la casse)."""
+        row = self.db.execute(f"SELECT {_USER_COLS} FROM users WHERE email_key = ?", (email.lower(),)).fetchone()
+        return _user_from_row(row) if row else None
+
+
+class SQLiteProductRepository:
+    """Équivalent SQLite de `ProductRepository`.
+
+    Les mouvements de stock sont des UPDATE conditionnels exécutés dans une
+    transaction IMMEDIATE: ils restent atomiques entre threads et entre
+    processus partageant la base.
+    """
+    def __init__(self, db: SQLiteDatabase):
+        self.db = db
+
+    def add(self, product: Product):
+        """Ajoute ou met à jour un produit."""
+        self.db.execute(
+            f"INSERT OR REPLACE INTO products ({_PRODUCT_COLS}) VALUES (?, ?, ?, ?, ?, ?)",
+            (product.id, product.name, product.description, product.price_cents,
+             product.stock_qty, int(product.active)),
+        )
+
+    def get(self, product_id: str) -> Optional[Product]:
+        """Retourne le produit par identifiant ou None."""
+        row = self.db.execute(f"SELECT {_PRODUCT_COLS} FROM products WHERE id = ?", (product_id,)).fetchone()
+        return _product_from_row(row) if row else None
+
+    def list_active(self) -> List[Product]:
+        """Liste tous les produits actifs."""
+        rows = self.db.execute(f"SELECT {_PRODUCT_COLS} FROM products WHERE active = 1 ORDER BY rowid").fetchall()
+        return [_product_from_row(r) for r in rows]
+
+    def list_all(self) -> List[Product]:
+        """Liste tous les produits, actifs ou non."""
+        rows = self.db.execute(f"SELECT {_PRODUCT_COLS} FROM products ORDER BY rowid").fetchall()
+        return [_product_from_row(r) for r in rows]
+
+    def reserve_stock(self, product_id: str, qty: int, deactivate_when_empty: bool = False) -> int:
+        """Réserve `qty` unités; voir `ProductRepository.reserve_stock`."""
+        with self.db.transaction() as conn:
+            row = conn.execute("SELECT stock_qty FROM products WHERE id = ?", (product_id,)).fetchone()
+            if not row or row[0] < qty:
+                raise ValueError("Stock insuffisant.")
+            remaining = row[0] - qty
+            self._write_stock(conn, product_id, remaining, deactivate_when_empty)
+            return remaining
+
+    def reserve_many(self, lines: List[Tuple[str, int]], deactivate_when_empty: bool = False) -> List[Tuple[Product, int]]:
+        """Réserve un lot de lignes en tout-ou-rien, dans une seule transaction."""
+        with self.db.transaction() as conn:
+            wanted: Dict[str, int] = {}
+            for product_id, qty in lines:
+                wanted[product_id] = wanted.get(product_id, 0) + qty
+            found: Dict[str, Product] = {}
+            for product_id, qty in wanted.items():
+                row = conn.execute(f"SELECT {_PRODUCT_COLS} FROM products WHERE id = ?", (product_id,)).fetchone()
+                if not row:
+                    raise ValueError("Produit indisponible.")
+                p = _product_from_row(row)
+                if not p.active:
+                    raise ValueError("Produit indisponible.")
+                if p.stock_qty < qty:
+                    raise ValueError(f"Stock insuffisant pour {p.name}.")
+                found[product_id] = p
+            for product_id, qty in wanted.items():
+                p = found[product_id]
+                p.stock_qty -= qty
+                if deactivate_when_empty and p.stock_qty <= 0:
+                    p.active = False
+                self._write_stock(conn, product_id, p.stock_qty, deactivate_when_empty)
+        return [(found[product_id], qty) for product_id, qty in lines]
+
+    def release_stock(self, product_id: str, qty: int):
+        """Remet `qty` unités en stock pour le produit donné (si trouvé)."""
+        self.db.execute("UPDATE products SET stock_qty = stock_qty + ? WHERE id = ?", (qty, product_id))
+
+    def set_stock(self, product_id: str, qty: int):
+        """Fixe le stock d'un produit (si trouvé)."""
+        self.db.execute("UPDATE products SET stock_qty = ? WHERE id = ?", (qty, product_id))
+
+    @staticmethod
+    def _write_stock(conn: sqlite3.Connection, product_id: str, stock_qty: int, deactivate_when_empty: bool):
+        if deactivate_when_empty and stock_qty <= 0:
+            conn.execute("UPDATE products SET stock_qty = ?, active = 0 WHERE id = ?", (stock_qty, product_id))
+        else:
+            conn.execute("UPDATE products SET stock_qty = ? WHERE id = ?", (stock_qty, product_id))
+
+
+class SQLiteCartRepository:
+    """Équivalent SQLite de `CartRepository` (un panier JSON par utilisateur)."""
+    def __init__(self, db: SQLiteDatabase):
+        self.db = db
+
+    def get_or_create(self, user_id: str) -> Cart:
+        """Retourne le panier de l'utilisateur (vide s'il n'existe pas)."""
+        row = self.db.execute("SELECT data FROM carts WHERE user_id = ?", (user_id,)).fetchone()
+        return loads(Cart, row[0]) if row else Cart(user_id=user_id)
+
+    def update(self, cart: Cart):
+        """Enregistre un panier modifié."""
+        self.db.execute("INSERT OR REPLACE INTO carts (user_id, data) VALUES (?, ?)", (cart.user_id, dumps(cart)))
+
+    def clear(self, user_id: str):
+        """Vide le panier de l'utilisateur donné."""
+        self.db.execute("DELETE FROM carts WHERE user_id = ?", (user_id,))
+
+
+class SQLiteOrderRepository:
+    """Équivalent SQLite de `OrderRepository`."""
+    def __init__(self, db: SQLiteDatabase):
+        self.db = db
+
+    def add(self, order: Order):
+        """Ajoute une commande."""
+        self.db.execute(
+            "INSERT INTO orders (id, user_id, status, created_at, data) VALUES (?, ?, ?, ?, ?)",
+            (order.id, order.user_id, order.status.name, order.created_at, dumps(order)),
+        )
+
+    def get(self, order_id: str) -> Optional[Order]:
+        """Retourne la commande par identifiant ou None."""
+        row = self.db.execute("SELECT data FROM orders WHERE id = ?", (order_id,)).fetchone()
+        return loads(Order, row[0]) if row else None
+
+    def list_by_user(self, user_id: str) -> List[Order]:
+        """Liste les commandes d'un utilisateur (ordre d'ajout)."""
+        rows = self.db.execute("SELECT data FROM orders WHERE user_id = ? ORDER BY seq", (user_id,)).fetchall()
+        return [loads(Order, r[0]) for r in rows]
+
+    def update(self, order: Order):
+        """Met à jour une commande existante (ou l'ajoute)."""
+        cur = self.db.execute(
+            "UPDATE orders SET user_id = ?, status = ?, created_at = ?, data = ? WHERE id = ?",
+            (order.user_id, order.status.name, order.created_at, dumps(order), order.id),
+        )
+        if cur.rowcount == 0:
+            self.add(order)
+
+    def list_all(self) -> List[Order]:
+        """Liste toutes les commandes (ordre d'ajout)."""
+        rows = self.db.execute("SELECT data FROM orders ORDER BY seq").fetchall()
+        return [loads(Order, r[0]) for r in rows]
+
+    def list_by_status(self, status: OrderStatus) -> List[Order]:
+        """Liste les commandes d'un statut donné par date croissante (index orders_status_created)."""
+        rows = self.db.execute(
+            "SELECT data FROM orders WHERE status = ? ORDER BY created_at, id", (status.name,)
+        ).fetchall()
+        return [loads(Order, r[0]) for r in rows]
+
+    def count_by_status(self) -> Dict[OrderStatus, int]:
+        """Nombre de commandes par statut."""
+        rows = self.db.execute("SELECT status, COUNT(*) FROM orders GROUP BY status").fetchall()
+        return {OrderStatus[status]: n for status, n in rows}
+
+    def list_created_between(self, start: Optional[float] = None, end: Optional[float] = None) -> List[Order]:
+        """Liste les commandes créées dans [start, end[ (index orders_created)."""
+        rows = self.db.execute(
+            "SELECT data FROM orders WHERE created_at >= ? AND created_at < ? ORDER BY created_at, id",
+            (float("-inf") if start is None else start, float("inf") if end is None else end),
+        ).fetchall()
+        return [loads(Order, r[0]) for r in rows]
+
+    def page(self, limit: int, after: Optional[Tuple[float, str]] = None,
+             status: Optional[OrderStatus] = None, user_id: Optional[str] = None,
+             created_from: Optional[float] = None, created_to: Optional[float] = None
+             ) -> Tuple[List[Order], Optional[Tuple[float, str]]]:
+        """Pagination par curseur (created_at, id), voir `OrderRepository.page`."""
+        where, params = [], []
+        if after is not None:
+            where.append("(created_at > ? OR (created_at = ? AND id > ?))")
+            params += [after[0], after[0], after[1]]
+        if status is not None:
+            where.append("status = ?")
+            params.append(status.name)
+        if user_id is not None:
+            where.append("user_id = ?")
+            params.append(user_id)
+        if created_from is not None:
+            where.append("created_at >= ?")
+            params.append(created_from)
+        if created_to is not None:
+            where.append("created_at < ?")
+            params.append(created_to)
+        sql = "SELECT created_at, id, data FROM orders"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        rows = self.db.execute(sql + " ORDER BY created_at, id LIMIT ?", (*params, limit + 1)).fetchall()
+        items = [loads(Order, r[2]) for r in rows[:limit]]
+        next_key = (rows[limit - 1][0], rows[limit - 1][1]) if len(rows) > limit else None
+        return items, next_key
+
+    def iter_all(self, chunk_size: int = 1000, **filters) -> Iterator[Order]:
+        """Itère sur les commandes par lots (requêtes keyset successives)."""
+        after = None
+        while True:
+            items, after = self.page(chunk_size, after=after, **filters)
+            yield from items
+            if after is None:
+                return
+
+
+class SQLiteInvoiceRepository:
+    """Équivalent SQLite de `InvoiceRepository`."""
+    def __init__(self, db: SQLiteDatabase):
+        self.db = db
+
+    def add(self, invoice: Invoice):
+        """Ajoute une facture."""
+        self.db.execute(
+            "INSERT OR REPLACE INTO invoices (id, order_id, user_id, data) VALUES (?, ?, ?, ?)",
+            (invoice.id, invoice.order_id, invoice.user_id, dumps(invoice)),
+        )
+
+    def get(self, invoice_id: str) -> Optional[Invoice]:
+        """Retourne la facture par identifiant ou None."""
+        row = self.db.execute("SELECT data FROM invoices WHERE id = ?", (invoice_id,)).fetchone()
+        return loads(Invoice, row[0]) if row else None
+
+    def iter_all(self, chunk_size: int = 1000) -> Iterator[Invoice]:
+        """Itère sur les factures par lots, en keyset sur la clé primaire.
+
+        Chaque lot est une requête courte sur la connexion du thread courant:
+        le générateur peut donc être repris depuis un autre thread.
+        """
+        last = ""
+        while True:
+            rows = self.db.execute(
+                "SELECT id, data FROM invoices WHERE id > ? ORDER BY id LIMIT ?", (last, chunk_size)
+            ).fetchall()
+            for _, data in rows:
+                yield loads(Invoice, data)
+            if len(rows) < chunk_size:
+                return
+            last = rows[-1][0]
+
+
+class SQLitePaymentRepository:
+    """Équivalent SQLite de `PaymentRepository`."""
+    def __init__(self, db: SQLiteDatabase):
+        self.db = db
+
+    def add(self, payment: Payment):
+        """Ajoute un paiement."""
+        self.db.execute(
+            "INSERT OR REPLACE INTO payments (id, order_id, user_id, created_at, data) VALUES (?, ?, ?, ?, ?)",
+            (payment.id, payment.order_id, payment.user_id, payment.created_at, dumps(payment)),
+        )
+
+    def get(self, payment_id: str) -> Optional[Payment]:
+        """Retourne le paiement par identifiant ou None."""
+        row = self.db.execute("SELECT data FROM payments WHERE id = ?", (payment_id,)).fetchone()
+        return loads(Payment, row[0]) if row else None
+
+    def iter_all(self, chunk_size: int = 1000) -> Iterator[Payment]:
+        """Itère sur les paiements par lots, en keyset sur la clé primaire.
+
+        Chaque lot est une requête courte sur la connexion du thread courant:
+        le générateur peut donc être repris depuis un autre thread.
+        """
+        last = ""
+        while True:
+            rows = self.db.execute(
+                "SELECT id, data FROM payments WHERE id > ? ORDER BY id LIMIT ?", (last, chunk_size)
+            ).fetchall()
+            for _, data in rows:
+                yield loads(Payment, data)
+            if len(rows) < chunk_size:
+                return
+            last = rows[-1][0]
+
+
+class SQLiteThreadRepository:
+    """Équivalent SQLite de `ThreadRepository` (messages inclus dans le fil)."""
+    def __init__(self, db: SQLiteDatabase):
+        self.db = db
+
+    def add(self, thread: MessageThread):
+        """Ajoute un fil de discussion."""
+        self.db.execute(
+            "INSERT INTO threads (id, user_id, closed, created_at, data) VALUES (?, ?, ?, ?, ?)",
+            (thread.id, thread.user_id, int(thread.closed), thread.created_at, dumps(thread)),
+        )
+
+    def update(self, thread: MessageThread):
+        """Enregistre un fil modifié (ou l'ajoute)."""
+        cur = self.db.execute(
+            "UPDATE threads SET user_id = ?, closed = ?, data = ? WHERE id = ?",
+            (thread.user_id, int(thread.closed), dumps(thread), thread.id),
+        )
+        if cur.rowcount == 0:
+            self.add(thread)
+
+    def get(self, thread_id: str) -> Optional[MessageThread]:
+        """Récupère un fil par identifiant."""
+        row = self.db.execute("SELECT data FROM threads WHERE id = ?", (thread_id,)).fetchone()
+        return loads(MessageThread, row[0]) if row else None
+
+    def list_by_user(self, user_id: str) -> List[MessageThread]:
+        """Liste les fils appartenant à un utilisateur."""
+        rows = self.db.execute("SELECT data FROM threads WHERE user_id = ? ORDER BY seq", (user_id,)).fetchall()
+        return [loads(MessageThread, r[0]) for r in rows]
+
+    def list_all(self) -> List[MessageThread]:
+        """Liste tous les fils de discussion."""
+        rows = self.db.execute("SELECT data FROM threads ORDER BY seq").fetchall()
+        return [loads(MessageThread, r[0]) for r in rows]
+
+    def list_by_state(self, closed: bool) -> List[MessageThread]:
+        """Liste les fils ouverts (closed=False) ou fermés (index threads_closed)."""
+        rows = self.db.execute("SELECT data FROM threads WHERE closed = ? ORDER BY seq", (int(closed),)).fetchall()
+        return [loads(MessageThread, r[0]) for r in rows]
+
+
+class SQLiteBackend(_ImmediateWrites):
+    """Backend persistant: repositories SQLite sur un fichier partagé."""
+    def __init__(self, path: str):
+        self.db = SQLiteDatabase(path)
+        self.users = SQLiteUserRepository(self.db)
+        self.products = SQLiteProductRepository(self.db)
+        self.carts = SQLiteCartRepository(self.db)
+        self.orders = SQLiteOrderRepository(self.db)
+        self.invoices = SQLiteInvoiceRepository(self.db)
+        self.payments = SQLitePaymentRepository(self.db)
+        self.threads = SQLiteThreadRepository(self.db)
+        # Les sessions restent en mémoire, propres à chaque processus
+        self.sessions = SessionManager()
+
+    def close(self):
+        """Ferme les connexions SQLite."""
+        self.db.close()
+
+
+def create_backend(kind: str = "memory", path: Optional[str] = None):
+    """Instancie le backend demandé ("memory", "sqlite" ou "journal").
+
+    `path` est le fichier SQLite ou le répertoire du journal.
+
+    Raises:
+        ValueError: si le type de backend est inconnu.
+    """
+    if kind == "memory":
+        return InMemoryBackend()
+    if kind == "sqlite":
+        return SQLiteBackend(path or "shop.db")
+    if kind == "journal":
+        from api.journal import JournaledBackend
+        return JournaledBackend(path or "journal")
+    raise ValueError(f"Backend de stockage inconnu: {kind}")
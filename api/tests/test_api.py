@@ -0,0 +1,70 @@
+import importlib.util
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("httpx")
+from fastapi.testclient import TestClient
+
+API_PATH = os.path.join(os.path.dirname(__file__), "..", "api-shop.py")
+
+
+@pytest.fixture
+def start_api(monkeypatch):
+    """Démarre une instance de l'API sur le backend demandé (nouvel import = nouveau processus simulé)."""
+    started = []
+
+    def start(kind="memory", path=None):
+        monkeypatch.setenv("SHOP_STORAGE", kind)
+        if path:
+            monkeypatch.setenv("SHOP_DB_PATH", path)
+        spec = importlib.util.spec_from_file_location("api_shop_under_test", API_PATH)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        started.append(module)
+        return TestClient(module.app), module
+
+    yield start
+    for module in started:
+        module.storage.close()
+
+
+LOGIN = {"email": "alice@test.com", "password": "123", "first_name": "", "last_name": "", "address": ""}
+
+
+def test_update_product_stock_persists_on_sqlite(start_api, tmp_path):
+    client, _ = start_api("sqlite", str(tmp_path / "shop.db"))
+    body = {"name": "ProduitA", "description": "DescA", "price_cents": 1200, "stock_qty": 777}
+    r = client.put("/products/p1", json=body)
+    assert r.status_code == 200
+    assert r.json()["stock_qty"] == 777
+    stored = client.get("/products/p1").json()
+    assert stored["stock_qty"] == 777 and stored["price_cents"] == 1200
+
+
+@pytest.mark.parametrize("kind, name", [("sqlite", "shop.db"), ("journal", "journal")])
+def test_seeded_user_can_login_after_restart(start_api, tmp_path, kind, name):
+    path = str(tmp_path / name)
+    # premier démarrage dans un autre processus (graine de hash() différente)
+    seed = (
+        "import importlib.util, sys; sys.path.insert(0, sys.argv[2]);"
+        "spec = importlib.util.spec_from_file_location('api_shop', sys.argv[1]);"
+        "m = importlib.util.module_from_spec(spec); spec.loader.exec_module(m); m.storage.close()"
+    )
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+    env = dict(os.environ, SHOP_STORAGE=kind, SHOP_DB_PATH=path, PYTHONHASHSEED="12345")
+    subprocess.run([sys.executable, "-c", seed, API_PATH, root], env=env, check=True)
+    client, _ = start_api(kind, path)
+    assert client.post("/users/login", json=LOGIN).status_code == 200
+
+
+def test_journal_request_waits_for_durability_once(start_api, tmp_path):
+    client, module = start_api("journal", str(tmp_path / "journal"))
+    waits = []
+    real_wait = module.storage.journal.wait
+    module.storage.journal.wait = lambda seq: (waits.append(seq), real_wait(seq))
+    assert client.post("/cart/u1/add", json={"product_id": "p1", "quantity": 2}).status_code == 200
+    assert client.post("/orders/checkout/u1").status_code == 200
+    assert waits == [waits[0], module.storage.journal.last_seq] and waits[0] < waits[1]
@@ -0,0 +1,98 @@
+import csv
+import io
+import json
+
+import pytest
+
+from api.export import csv_lines, ndjson_lines, stream
+from api.shop import Invoice, InvoiceLine, Order, OrderItem, OrderStatus, Payment
+from api.storage import InMemoryBackend, SQLiteBackend, loads
+
+
+def _fill(backend, n):
+    for i in range(n):
+        backend.orders.add(Order(
+            id=f"o{i:03d}", user_id="u1", status=OrderStatus.PAYEE, created_at=float(i),
+            items=[OrderItem(product_id="p1", name="P, \"1\"", unit_price_cents=250, quantity=2)],
+        ))
+        backend.invoices.add(Invoice(
+            id=f"i{i:03d}", order_id=f"o{i:03d}", user_id="u1", total_cents=500, issued_at=float(i),
+            lines=[InvoiceLine(product_id="p1", name="P", unit_price_cents=250, quantity=2, line_total_cents=500)],
+        ))
+        backend.payments.add(Payment(
+            id=f"pay{i:03d}", order_id=f"o{i:03d}", user_id="u1", amount_cents=500,
+            provider="CB", provider_ref=None, succeeded=True, created_at=float(i),
+        ))
+
+
+def test_ndjson_lines_roundtrip_with_codec():
+    backend = InMemoryBackend()
+    _fill(backend, 3)
+    lines = list(ndjson_lines(backend.orders.iter_all()))
+    assert len(lines) == 3 and all(line.endswith("\n") for line in lines)
+    assert json.loads(lines[0])["status"] == "PAYEE"
+    assert loads(Order, lines[2]) == backend.orders.get("o002")
+
+
+def test_csv_lines_header_and_escaping():
+    backend = InMemoryBackend()
+    _fill(backend, 2)
+    rows = list(csv.reader(io.StringIO("".join(csv_lines("payments", backend.payments.iter_all())))))
+    assert rows[0][:4] == ["id", "order_id", "user_id", "amount_cents"]
+    assert rows[1][:4] == ["pay000", "o000", "u1", "500"]
+    assert rows[1][5] == ""  # provider_ref absent
+    order_rows = list(csv.reader(io.StringIO("".join(stream("orders", "csv", backend.orders.iter_all())))))
+    assert order_rows[1][5] == "500"
+
+
+def test_stream_rejects_unknown_kind_or_format():
+    with pytest.raises(ValueError):
+        stream("users", "csv", [])
+    with pytest.raises(ValueError):
+        stream("orders", "xml", [])
+
+
+def test_iter_all_tolerates_inserts_during_iteration():
+    backend = InMemoryBackend()
+    _fill(backend, 5)
+    seen = []
+    for order in backend.orders.iter_all(chunk_size=2):
+        seen.append(order.id)
+        if order.id == "o000":
+            backend.orders.add(Order(id="late", user_id="u2", items=[], status=OrderStatus.CREE, created_at=99.0))
+    assert seen == ["o000", "o001", "o002", "o003", "o004", "late"]
+    for invoice in backend.invoices.iter_all():
+        backend.invoices.add(Invoice(id=f"x{invoice.id}", order_id="o", user_id="u", lines=[],
+                                     total_cents=0, issued_at=0.0))
+    assert len(list(backend.invoices.iter_all())) == 10
+
+
+def test_sqlite_iter_all_in_chunks(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "shop.db"))
+    _fill(backend, 7)
+    assert [o.id for o in backend.orders.iter_all(chunk_size=3)] == [f"o{i:03d}" for i in range(7)]
+    assert [i.id for i in backend.invoices.iter_all(chunk_size=3)] == [f"i{i:03d}" for i in range(7)]
+    assert [p.id for p in backend.payments.iter_all(chunk_size=7)] == [f"pay{i:03d}" for i in range(7)]
+    backend.close()
+
+
+def test_stream_groups_lines_into_chunks():
+    backend = InMemoryBackend()
+    _fill(backend, 50)
+    lines = list(ndjson_lines(backend.orders.iter_all()))
+    chunks = list(stream("orders", "ndjson", backend.orders.iter_all(), chunk_bytes=4096))
+    assert "".join(chunks) == "".join(lines)
+    assert 1 < len(chunks) < len(lines)
+    assert all(len(c) >= 4096 for c in chunks[:-1])
+
+
+def test_memory_iter_all_walks_append_only_ids():
+    backend = InMemoryBackend()
+    _fill(backend, 5)
+    walk = backend.payments.iter_all(chunk_size=2)
+    assert next(walk).id == "pay000"
+    backend.payments.add(Payment(id="late", order_id="o", user_id="u", amount_cents=1,
+                                 provider="CB", provider_ref=None, succeeded=True, created_at=0.0))
+    # un ré-enregistrement du même id ne crée pas de doublon
+    backend.payments.add(backend.payments.get("pay001"))
+    assert [p.id for p in walk] == ["pay001", "pay002", "pay003", "pay004", "late"]
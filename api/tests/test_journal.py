@@ -0,0 +1,173 @@
+import os
+import threading
+
+import pytest
+
+from api.journal import EventJournal, JournaledBackend, list_segments, read_records
+from api.shop import (
+    AuthService, BillingService, CartService, CustomerService, DeliveryService,
+    OrderService, OrderStatus, PaymentGateway, Product,
+)
+
+
+def build_services(backend):
+    billing = BillingService(backend.invoices)
+    return {
+        'auth': AuthService(backend.users, backend.sessions),
+        'cart_svc': CartService(backend.carts, backend.products),
+        'order_svc': OrderService(
+            backend.orders, backend.products, backend.carts, backend.payments, backend.invoices,
+            billing, DeliveryService(), PaymentGateway(), backend.users
+        ),
+        'cs': CustomerService(backend.threads, backend.users),
+    }
+
+
+def test_event_journal_roundtrip_and_torn_tail(tmp_path):
+    journal = EventJournal(str(tmp_path), flush_interval_ms=1)
+    seqs = [journal.append(f"evt-{i}".encode()) for i in range(5)]
+    journal.wait(seqs[-1])
+    journal.close()
+    # simule un crash au milieu de l'écriture d'un enregistrement
+    (_, path), = list_segments(str(tmp_path))
+    with open(path, "ab") as f:
+        f.write(b"\x10\x00\x00\x00garbage")
+    records = list(read_records(str(tmp_path)))
+    assert [s for s, _ in records] == [1, 2, 3, 4, 5]
+    assert records[-1][1] == b"evt-4"
+    assert [s for s, _ in read_records(str(tmp_path), after_seq=3)] == [4, 5]
+
+
+def test_group_commit_batches_fsyncs(tmp_path):
+    journal = EventJournal(str(tmp_path), flush_interval_ms=5)
+
+    def writer():
+        for _ in range(20):
+            journal.wait(journal.append(b"x"))
+
+    workers = [threading.Thread(target=writer) for _ in range(16)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    journal.close()
+    assert journal.last_seq == 320
+    assert journal.fsync_count < 320
+
+
+def test_journaled_backend_recovers_after_restart(tmp_path):
+    directory = str(tmp_path / "j")
+    backend = JournaledBackend(directory, flush_interval_ms=1)
+    svc = build_services(backend)
+    backend.products.add(Product(id="p1", name="P1", description="d", price_cents=500, stock_qty=4))
+    user = svc['auth'].register("j@x.com", "pw", "A", "B", "addr")
+    token = svc['auth'].login("j@x.com", "pw")
+    svc['cart_svc'].add_to_cart(user.id, "p1", 3)
+    order = svc['order_svc'].checkout(user.id)
+    svc['order_svc'].pay_by_card(order.id, "4242424242424242", 12, 2030, "123")
+    svc['cart_svc'].add_to_cart(user.id, "p1", 1)
+    th = svc['cs'].open_thread(user.id, "Sujet", order.id)
+    svc['cs'].post_message(th.id, user.id, "Bonjour")
+    backend.close()
+
+    backend = JournaledBackend(directory, flush_interval_ms=1)
+    assert backend.recovery_stats["snapshot_seq"] == 0
+    assert backend.users.get_by_email("j@x.com").id == user.id
+    assert backend.sessions.get_user_id(token) == user.id
+    assert backend.products.get("p1").stock_qty == 1
+    assert backend.carts.get_or_create(user.id).items["p1"].quantity == 1
+    restored = backend.orders.get(order.id)
+    assert restored.status is OrderStatus.PAYEE
+    assert backend.invoices.get(restored.invoice_id).total_cents == 1500
+    assert [o.id for o in backend.orders.list_by_user(user.id)] == [order.id]
+    assert backend.threads.list_by_user(user.id)[0].messages[0].body == "Bonjour"
+    backend.close()
+
+
+def test_snapshot_bounds_replay_and_purges_segments(tmp_path):
+    directory = str(tmp_path / "j")
+    backend = JournaledBackend(directory, flush_interval_ms=1)
+    svc = build_services(backend)
+    backend.products.add(Product(id="p1", name="P1", description="d", price_cents=100, stock_qty=100))
+    for i in range(10):
+        svc['cart_svc'].add_to_cart(f"u{i}", "p1", 1)
+        svc['order_svc'].checkout(f"u{i}")
+    seq = backend.snapshot()
+    assert len(list_segments(directory)) == 1
+    svc['cart_svc'].add_to_cart("late", "p1", 2)
+    svc['cart_svc'].clear_cart("u0")
+    backend.close()
+
+    backend = JournaledBackend(directory, flush_interval_ms=1)
+    assert backend.recovery_stats["snapshot_seq"] == seq
+    assert backend.recovery_stats["replayed"] == 2
+    assert len(backend.orders.list_all()) == 10
+    assert backend.products.get("p1").stock_qty == 90
+    assert backend.carts.get_or_create("late").items["p1"].quantity == 2
+    backend.close()
+
+
+def test_failed_mutation_is_not_journaled(tmp_path):
+    directory = str(tmp_path / "j")
+    backend = JournaledBackend(directory, flush_interval_ms=1)
+    backend.products.add(Product(id="p1", name="P1", description="d", price_cents=100, stock_qty=1))
+    with pytest.raises(ValueError):
+        backend.products.reserve_stock("p1", 5)
+    backend.close()
+    assert len(list(read_records(directory))) == 1
+
+
+def test_durable_scope_waits_once(tmp_path):
+    backend = JournaledBackend(str(tmp_path / "j"), flush_interval_ms=1)
+    svc = build_services(backend)
+    backend.products.add(Product(id="p1", name="P1", description="d", price_cents=500, stock_qty=4))
+    waits = []
+    real_wait = backend.journal.wait
+    backend.journal.wait = lambda seq: (waits.append(seq), real_wait(seq))
+    with backend.durable() as scope:
+        svc['cart_svc'].add_to_cart("u1", "p1", 1)
+        order = svc['order_svc'].checkout("u1")
+        svc['order_svc'].pay_by_card(order.id, "4242424242424242", 12, 2030, "123")
+        assert waits == []
+    assert waits == [scope.last_seq] and scope.last_seq == backend.journal.last_seq
+    backend.products.release_stock("p1", 1)
+    assert len(waits) == 2
+    backend.close()
+
+
+def test_commits_on_other_products_do_not_wait_for_a_busy_stripe(tmp_path):
+    import api.journal as journal_mod
+    backend = JournaledBackend(str(tmp_path / "j"), flush_interval_ms=1)
+    backend.products.add(Product(id="a", name="A", description="d", price_cents=1, stock_qty=5))
+    backend.products.add(Product(id="b", name="B", description="d", price_cents=1, stock_qty=5))
+    busy = backend._stripes[hash(("products", "a")) % journal_mod._COMMIT_STRIPES]
+    other = backend._stripes[hash(("products", "b")) % journal_mod._COMMIT_STRIPES]
+    if busy is other:
+        pytest.skip("collision de stripes pour cette graine de hash")
+    done = threading.Event()
+    with busy:
+        worker = threading.Thread(target=lambda: (backend.products.reserve_stock("b", 1), done.set()))
+        worker.start()
+        assert done.wait(5)
+    worker.join()
+    assert backend.products.get("b").stock_qty == 4
+    backend.close()
+
+
+def test_writes_after_torn_first_record_survive_next_restart(tmp_path):
+    directory = str(tmp_path / "j")
+    backend = JournaledBackend(directory, flush_interval_ms=1)
+    backend.products.add(Product(id="p1", name="P1", description="d", price_cents=1, stock_qty=1))
+    backend.snapshot()
+    backend.close()
+    # crash pendant l'écriture du premier enregistrement du nouveau segment
+    path = list_segments(directory)[-1][1]
+    with open(path, "ab") as f:
+        f.write(b"\x10\x00\x00\x00garbage")
+    backend = JournaledBackend(directory, flush_interval_ms=1)
+    backend.products.add(Product(id="p2", name="P2", description="d", price_cents=1, stock_qty=1))
+    backend.close()
+    backend = JournaledBackend(directory, flush_interval_ms=1)
+    assert backend.products.get("p1") is not None
+    assert backend.products.get("p2") is not None
+    backend.close()
@@ -406,3 +406,38 @@ def test_checkout_deactivates_product_when_stock_zero(services, users, products)
     assert updated_p.stock_qty == 0
     assert updated_p.active is False
     assert order.items[0].product_id == p.id
+
+
+def test_checkout_failure_leaves_stock_and_cart_untouched(services, users, products):
+    """Une ligne en rupture fait échouer tout le checkout sans débiter les autres lignes."""
+    order_svc = services['order_svc']
+    cart_svc = services['cart_svc']
+    from api.shop import CartItem
+    user = services['auth'].register("batch@x.com", "pw", "A", "B", "addr")
+    lines = [Product(id=f"b{i}", name=f"B{i}", description="d", price_cents=100, stock_qty=5) for i in range(50)]
+    for p in lines:
+        products.add(p)
+        cart_svc.add_to_cart(user.id, p.id, 2)
+    short = Product(id="bshort", name="Short", description="d", price_cents=100, stock_qty=1)
+    products.add(short)
+    cart_svc.view_cart(user.id).items[short.id] = CartItem(product_id=short.id, quantity=3)
+    with pytest.raises(ValueError, match="Short"):
+        order_svc.checkout(user.id)
+    assert all(p.stock_qty == 5 for p in lines)
+    assert short.stock_qty == 1
+    assert len(cart_svc.view_cart(user.id).items) == 51
+    assert order_svc.view_orders(user.id) == []
+
+
+def test_product_repository_reserve_many(products):
+    a = Product(id="rm_a", name="A", description="d", price_cents=100, stock_qty=3)
+    b = Product(id="rm_b", name="B", description="d", price_cents=100, stock_qty=2)
+    products.add(a)
+    products.add(b)
+    # quantités cumulées pour un même produit
+    res = products.reserve_many([("rm_a", 1), ("rm_b", 2), ("rm_a", 2)], deactivate_when_empty=True)
+    assert [p.id for p, _ in res] == ["rm_a", "rm_b", "rm_a"]
+    assert a.stock_qty == 0 and b.stock_qty == 0
+    assert a.active is False and b.active is False
+    with pytest.raises(ValueError):
+        products.reserve_many([("missing", 1)])
@@ -63,6 +63,36 @@ def test_reserve_release_edge_cases(products):
     products.reserve_stock("p4", -1)
     assert products.get("p4").stock_qty == 3
 
+
+def test_reserve_stock_concurrent_never_oversells(products):
+    import sys
+    import threading
+    p = Product(id="flash", name="Flash", description="d", price_cents=100, stock_qty=500)
+    products.add(p)
+    sold = []
+
+    def buyer():
+        for _ in range(100):
+            try:
+                products.reserve_stock("flash", 1, deactivate_when_empty=True)
+                sold.append(1)
+            except ValueError:
+                pass
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        workers = [threading.Thread(target=buyer) for _ in range(8)]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert len(sold) == 500
+    assert p.stock_qty == 0
+    assert p.active is False
+
 @pytest.fixture
 def sample_products():
     """Crée un jeu de produits pour les tests."""
@@ -117,4 +147,132 @@ def test_list_all_products_delegates_to_repository(product_repo, sample_products
 def test_list_all_products_with_empty_repo():
     """Vérifie que le service retourne une liste vide quand le repo est vide."""
     service = CatalogService(ProductRepository())
-    assert service.list_all_products() == []
\ No newline at end of file
+    assert service.list_all_products() == []
+
+# ==========================================================
+# 🗂️ Index secondaires de OrderRepository
+# ==========================================================
+
+def _order(oid, status, created_at, user_id="u1"):
+    from api.shop import Order
+    return Order(id=oid, user_id=user_id, items=[], status=status, created_at=created_at)
+
+
+def test_order_repository_status_index_follows_updates(orders):
+    from api.shop import OrderStatus
+    o1 = _order("o1", OrderStatus.CREE, 10.0)
+    o2 = _order("o2", OrderStatus.CREE, 20.0)
+    orders.add(o1)
+    orders.add(o2)
+    assert orders.list_by_status(OrderStatus.CREE) == [o1, o2]
+    o1.status = OrderStatus.PAYEE
+    orders.update(o1)
+    assert orders.list_by_status(OrderStatus.CREE) == [o2]
+    assert orders.list_by_status(OrderStatus.PAYEE) == [o1]
+    assert orders.list_by_status(OrderStatus.LIVREE) == []
+    assert orders.count_by_status() == {OrderStatus.CREE: 1, OrderStatus.PAYEE: 1}
+
+
+def test_order_repository_created_at_range(orders):
+    from api.shop import OrderStatus
+    for i, ts in enumerate([30.0, 10.0, 20.0, 40.0]):
+        orders.add(_order(f"o{i}", OrderStatus.CREE, ts))
+    assert [o.created_at for o in orders.list_created_between(15.0, 40.0)] == [20.0, 30.0]
+    assert [o.created_at for o in orders.list_created_between(start=30.0)] == [30.0, 40.0]
+    assert [o.created_at for o in orders.list_created_between(end=20.0)] == [10.0]
+    # remplacement avec une autre date de création: l'ancienne entrée disparaît
+    orders.update(_order("o1", OrderStatus.CREE, 50.0))
+    assert [o.id for o in orders.list_created_between()] == ["o2", "o0", "o3", "o1"]
+
+
+def test_service_transitions_keep_status_index(services, users, products, orders):
+    from api.shop import OrderStatus
+    auth = services['auth']
+    order_svc = services['order_svc']
+    p = Product(id="idx1", name="I", description="d", price_cents=100, stock_qty=10)
+    products.add(p)
+    admin = auth.register("idxadm@x.com", "pw", "A", "B", "addr", is_admin=True)
+    user = auth.register("idxuser@x.com", "pw", "C", "D", "addr")
+    services['cart_svc'].add_to_cart(user.id, p.id, 1)
+    order = order_svc.checkout(user.id)
+    order_svc.backoffice_validate_order(admin.id, order.id)
+    order_svc.pay_by_card(order.id, "4242424242424242", 12, 2030, "123")
+    assert orders.list_by_status(OrderStatus.PAYEE) == [order]
+    order_svc.backoffice_ship_order(admin.id, order.id)
+    order_svc.backoffice_mark_delivered(admin.id, order.id)
+    assert orders.list_by_status(OrderStatus.LIVREE) == [order]
+    assert orders.count_by_status() == {OrderStatus.LIVREE: 1}
+
+
+def _drain(orders, limit, **filters):
+    seen, after = [], None
+    while True:
+        items, after = orders.page(limit, after=after, **filters)
+        seen += [o.id for o in items]
+        if after is None:
+            return seen
+
+
+def test_order_repository_page_walks_in_created_order(orders):
+    from api.shop import OrderStatus
+    for i in range(10):
+        status = OrderStatus.PAYEE if i % 2 else OrderStatus.CREE
+        orders.add(_order(f"o{i}", status, float(i // 2), user_id=f"u{i % 3}"))
+    assert _drain(orders, 3) == [f"o{i}" for i in range(10)]
+    assert _drain(orders, 2, status=OrderStatus.PAYEE) == ["o1", "o3", "o5", "o7", "o9"]
+    assert _drain(orders, 2, user_id="u0") == ["o0", "o3", "o6", "o9"]
+    assert _drain(orders, 1, user_id="u0", status=OrderStatus.CREE) == ["o0", "o6"]
+    assert _drain(orders, 4, created_from=1.0, created_to=3.0) == ["o2", "o3", "o4", "o5"]
+    items, after = orders.page(10)
+    assert len(items) == 10 and after is None
+
+
+def test_order_repository_page_cursor_stable_across_inserts(orders):
+    from api.shop import OrderStatus
+    for i in range(4):
+        orders.add(_order(f"o{i}", OrderStatus.CREE, float(i)))
+    first, after = orders.page(2)
+    assert [o.id for o in first] == ["o0", "o1"]
+    # une commande plus ancienne et une plus récente arrivent entre deux pages
+    orders.add(_order("late", OrderStatus.CREE, 0.5))
+    orders.add(_order("new", OrderStatus.CREE, 9.0))
+    rest, after = orders.page(10, after=after)
+    assert [o.id for o in rest] == ["o2", "o3", "new"]
+    assert after is None
+
+
+# ==========================================================
+# 🎫 Index secondaires de ThreadRepository
+# ==========================================================
+
+def test_thread_repository_user_and_state_indexes(services, threads):
+    auth = services['auth']
+    cs = services['cs']
+    admin = auth.register("thadm@x.com", "pw", "A", "B", "addr", is_admin=True)
+    alice = auth.register("thalice@x.com", "pw", "C", "D", "addr")
+    t1 = cs.open_thread(alice.id, "Premier")
+    t2 = cs.open_thread("u2", "Autre")
+    t3 = cs.open_thread(alice.id, "Second")
+    assert threads.list_by_user(alice.id) == [t1, t3]
+    assert threads.list_by_user("inconnu") == []
+    assert threads.list_by_state(False) == [t1, t2, t3]
+    assert threads.list_by_state(True) == []
+
+    cs.post_message(t1.id, alice.id, "Bonjour")
+    cs.close_thread(t1.id, admin.id)
+    assert threads.list_by_state(False) == [t2, t3]
+    assert threads.list_by_state(True) == [t1]
+    # l'index par utilisateur ne bouge pas à la fermeture
+    assert threads.list_by_user(alice.id) == [t1, t3]
+
+
+def test_thread_repository_update_of_unknown_thread_is_indexed(threads):
+    from api.shop import MessageThread
+    th = MessageThread(id="t1", user_id="u9", order_id=None, subject="S", closed=True)
+    threads.update(th)
+    assert threads.list_by_user("u9") == [th]
+    assert threads.list_by_state(True) == [th]
+    th.closed = False
+    threads.update(th)
+    assert threads.list_by_state(True) == []
+    assert threads.list_by_state(False) == [th]
@@ -0,0 +1,166 @@
+import threading
+
+import pytest
+
+from api.shop import (
+    AuthService, BillingService, CartItem, CartService, CustomerService,
+    DeliveryService, Order, OrderItem, OrderService, OrderStatus, PaymentGateway,
+    Product, SessionManager,
+)
+from api.storage import InMemoryBackend, SQLiteBackend, create_backend, dumps, loads
+
+
+def build_services(backend):
+    billing = BillingService(backend.invoices)
+    return {
+        'auth': AuthService(backend.users, SessionManager()),
+        'cart_svc': CartService(backend.carts, backend.products),
+        'order_svc': OrderService(
+            backend.orders, backend.products, backend.carts, backend.payments, backend.invoices,
+            billing, DeliveryService(), PaymentGateway(), backend.users
+        ),
+        'cs': CustomerService(backend.threads, backend.users),
+    }
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "shop.db")
+
+
+def test_codec_roundtrip_nested_order():
+    order = Order(
+        id="o1", user_id="u1", status=OrderStatus.PAYEE, created_at=1.5,
+        items=[OrderItem(product_id="p1", name="P", unit_price_cents=100, quantity=2)],
+    )
+    back = loads(Order, dumps(order))
+    assert back == order
+    assert back.status is OrderStatus.PAYEE
+    assert isinstance(back.items[0], OrderItem)
+
+
+def test_create_backend_kinds(db_path):
+    assert isinstance(create_backend("memory"), InMemoryBackend)
+    backend = create_backend("sqlite", db_path)
+    assert isinstance(backend, SQLiteBackend)
+    backend.close()
+    with pytest.raises(ValueError):
+        create_backend("oracle")
+
+
+def test_sqlite_full_flow_survives_restart(db_path):
+    backend = SQLiteBackend(db_path)
+    svc = build_services(backend)
+    backend.products.add(Product(id="p1", name="P1", description="d", price_cents=1000, stock_qty=3))
+    user = svc['auth'].register("sql@x.com", "pw", "A", "B", "addr")
+    svc['cart_svc'].add_to_cart(user.id, "p1", 2)
+    assert svc['cart_svc'].cart_total(user.id) == 2000
+    order = svc['order_svc'].checkout(user.id)
+    payment = svc['order_svc'].pay_by_card(order.id, "4242424242424242", 12, 2030, "123")
+    th = svc['cs'].open_thread(user.id, "Question", order.id)
+    svc['cs'].post_message(th.id, user.id, "Bonjour")
+    backend.close()
+
+    backend = SQLiteBackend(db_path)
+    assert backend.users.get_by_email("SQL@x.com").id == user.id
+    assert backend.products.get("p1").stock_qty == 1
+    assert backend.carts.get_or_create(user.id).items == {}
+    stored = backend.orders.get(order.id)
+    assert stored.status is OrderStatus.PAYEE
+    assert stored.payment_id == payment.id
+    assert backend.invoices.get(stored.invoice_id).total_cents == 2000
+    assert backend.payments.get(payment.id).succeeded is True
+    assert [o.id for o in backend.orders.list_by_user(user.id)] == [order.id]
+    assert [m.body for m in backend.threads.list_by_user(user.id)[0].messages] == ["Bonjour"]
+    backend.close()
+
+
+def test_sqlite_checkout_is_all_or_nothing(db_path):
+    backend = SQLiteBackend(db_path)
+    svc = build_services(backend)
+    backend.products.add(Product(id="ok", name="OK", description="d", price_cents=100, stock_qty=5))
+    backend.products.add(Product(id="short", name="Short", description="d", price_cents=100, stock_qty=1))
+    svc['cart_svc'].add_to_cart("u1", "ok", 2)
+    cart = backend.carts.get_or_create("u1")
+    cart.items["short"] = CartItem(product_id="short", quantity=2)
+    backend.carts.update(cart)
+    with pytest.raises(ValueError, match="Short"):
+        svc['order_svc'].checkout("u1")
+    assert backend.products.get("ok").stock_qty == 5
+    assert len(backend.carts.get_or_create("u1").items) == 2
+    backend.close()
+
+
+def test_sqlite_reserve_stock_concurrent_threads(db_path):
+    backend = SQLiteBackend(db_path)
+    backend.products.add(Product(id="flash", name="F", description="d", price_cents=100, stock_qty=50))
+    sold = []
+
+    def buyer():
+        for _ in range(20):
+            try:
+                backend.products.reserve_stock("flash", 1, deactivate_when_empty=True)
+                sold.append(1)
+            except ValueError:
+                pass
+
+    workers = [threading.Thread(target=buyer) for _ in range(4)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    p = backend.products.get("flash")
+    assert len(sold) == 50
+    assert p.stock_qty == 0 and p.active is False
+    backend.close()
+
+
+def test_sqlite_order_secondary_indexes(db_path):
+    backend = SQLiteBackend(db_path)
+    for i, ts in enumerate([30.0, 10.0, 20.0]):
+        backend.orders.add(Order(id=f"o{i}", user_id="u1", items=[], status=OrderStatus.CREE, created_at=ts))
+    o = backend.orders.get("o1")
+    o.status = OrderStatus.PAYEE
+    backend.orders.update(o)
+    assert [x.id for x in backend.orders.list_by_status(OrderStatus.CREE)] == ["o2", "o0"]
+    assert backend.orders.count_by_status() == {OrderStatus.CREE: 2, OrderStatus.PAYEE: 1}
+    assert [x.created_at for x in backend.orders.list_created_between(15.0)] == [20.0, 30.0]
+    assert [x.created_at for x in backend.orders.list_created_between(end=20.0)] == [10.0]
+    backend.close()
+
+
+def _pages(repo, **filters):
+    pages, after = [], None
+    while True:
+        items, after = repo.page(2, after=after, **filters)
+        pages.append([o.id for o in items])
+        if after is None:
+            return pages
+
+
+def test_sqlite_order_page_matches_memory(db_path):
+    backend = SQLiteBackend(db_path)
+    memory = InMemoryBackend()
+    for i in range(9):
+        order = Order(id=f"o{i}", user_id=f"u{i % 2}", items=[], created_at=float(i // 3),
+                      status=OrderStatus.PAYEE if i % 3 == 0 else OrderStatus.CREE)
+        backend.orders.add(order)
+        memory.orders.add(order)
+    for filters in ({}, {"status": OrderStatus.CREE}, {"user_id": "u1"}, {"created_from": 1.0, "created_to": 2.0}):
+        assert _pages(backend.orders, **filters) == _pages(memory.orders, **filters)
+    assert _pages(backend.orders) == [["o0", "o1"], ["o2", "o3"], ["o4", "o5"], ["o6", "o7"], ["o8"]]
+    backend.close()
+
+
+def test_sqlite_thread_indexes(db_path):
+    backend = SQLiteBackend(db_path)
+    cs = build_services(backend)['cs']
+    t1 = cs.open_thread("u1", "Premier")
+    t2 = cs.open_thread("u2", "Autre")
+    t3 = cs.open_thread("u1", "Second")
+    t1.closed = True
+    backend.threads.update(t1)
+    assert [t.id for t in backend.threads.list_by_user("u1")] == [t1.id, t3.id]
+    assert [t.id for t in backend.threads.list_by_state(False)] == [t2.id, t3.id]
+    assert [t.id for t in backend.threads.list_by_state(True)] == [t1.id]
+    backend.close()
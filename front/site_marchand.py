@@ -873,16 +873,45 @@ elif page == "Admin":
         # ------------------------------------------------------
         st.subheader("📦 Gestion des commandes")
 
+        filtre_statut = st.selectbox(
+            "Filtrer par statut",
+            ["Tous", "CREE", "VALIDEE", "PAYEE", "EXPEDIEE", "LIVREE", "ANNULEE", "REMBOURSEE"],
+            key="admin_orders_status"
+        )
+
+        # Pagination par curseur: pile des curseurs des pages visitées (None = première page)
+        if st.session_state.get("admin_orders_filter") != filtre_statut:
+            st.session_state["admin_orders_filter"] = filtre_statut
+            st.session_state["admin_orders_cursors"] = [None]
+        curseurs = st.session_state["admin_orders_cursors"]
+
         try:
             admin_id = st.session_state["user_id"]
-            resp = requests.get(f"{API_URL}/admin/orders", params={"admin_user_id": admin_id})
+            params = {"admin_user_id": admin_id, "limit": 50}
+            if filtre_statut != "Tous":
+                params["status"] = filtre_statut
+            if curseurs[-1]:
+                params["after"] = curseurs[-1]
+            resp = requests.get(f"{API_URL}/admin/orders", params=params)
         except:
             st.error("Impossible de charger les commandes.")
         else:
             if resp.status_code != 200:
                 st.error("Erreur lors du chargement des commandes.")
             else:
-                commandes = resp.json()
+                resultat = resp.json()
+                commandes = resultat["items"]
+
+                st.caption(f"Page {len(curseurs)}")
+                col_prec, col_suiv = st.columns(2)
+                with col_prec:
+                    if len(curseurs) > 1 and st.button("⬅️ Page précédente", key="admin_orders_prev"):
+                        curseurs.pop()
+                        st.rerun()
+                with col_suiv:
+                    if resultat["next_cursor"] and st.button("Page suivante ➡️", key="admin_orders_next"):
+                        curseurs.append(resultat["next_cursor"])
+                        st.rerun()
 
                 if not commandes:
                     st.info("Aucune commande.")
@@ -960,8 +989,15 @@ elif page == "Admin":
         # ------------------------------------------------------
         st.markdown("## 🎫 Gestion des tickets support")
 
+        filtre_tickets = st.radio(
+            "Afficher", ["Ouverts", "Fermés", "Tous"], horizontal=True, key="admin_threads_state"
+        )
+        params_tickets = {}
+        if filtre_tickets != "Tous":
+            params_tickets["closed"] = "true" if filtre_tickets == "Fermés" else "false"
+
         try:
-            resp = requests.get(f"{API_URL}/admin/threads")
+            resp = requests.get(f"{API_URL}/admin/threads", params=params_tickets)
 
             if resp.status_code == 200:
                 threads = resp.json()